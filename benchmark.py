@@ -0,0 +1,420 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+
+### ===========================================================================
+### BENCHMARK FOR THE COMPRESS_* AND GFX_* SCRIPTS
+### ===========================================================================
+
+"""
+Generates a reproducible synthetic corpus of SymbOS assets and measures the
+run time of every compressor and converter on it. The results can be written
+as JSON and compared with the results of an earlier run.
+
+corpus:
+- SymExe10 executables with relocation tables (EXE, EXE with 16 colour icon,
+  WDG widget)
+- SYMHLP10 help file with many chapters
+- SGX graphic with simple and extended parts
+- 64K and 128K SNA snapshots
+- raw file (compress_file)
+- 4/8bpp BMPs in icon, font, bitmap and wallpaper sizes
+
+usage:
+python3 benchmark.py [options]
+
+options:
+--stage TEXT        only run the stages, whose name contains TEXT
+--repeat N          run every stage N times, the fastest run counts (default 1)
+--seed N            random seed of the corpus (default 1)
+--args TEXT         additional options for the compressors (e.g. "--draft")
+--out FILE          save the results as JSON in FILE
+--baseline FILE     compare the results with the ones in FILE
+--threshold PCT     a stage more than PCT% slower than the baseline is a
+                    regression (default 10); the exit code is 1 then
+--keep DIR          create the corpus and the outputs in DIR and keep them
+
+Every stage is run as its own process on a fresh copy of its input files,
+so the times include the start of Python (about 20-50ms). Besides the time
+the size of the input and output files is saved, so compression ratios can
+be compared as well.
+Stages, which are faster than 0.1s in both runs, are not checked against the
+threshold, as they are dominated by the process start.
+With the optimal compression of the in-process compressor a run takes about
+15 minutes on one core, mostly for the SNA stages; with the ZX0 tool (found
+in PATH or given with --args=--zx0-exe=PATH) it is much faster, and with
+--args=--draft it takes a second.
+
+example:
+python3 benchmark.py --repeat 3 --out base.json
+python3 benchmark.py --repeat 3 --baseline base.json
+"""
+
+
+BENCH_VERSION = 1       # change, if the corpus changes
+TIME_MIN = 0.1          # seconds, faster stages are not checked for regressions
+
+# Z80 instruction patterns (None = random operand byte) for synthetic code
+Z80_OPS = [[0x3e, None], [0x06, None], [0x0e, None], [0x21, None, None], [0x11, None, None], [0x01, None, None],
+           [0xcd, None, None], [0xc3, None, None], [0x18, None], [0x20, None], [0x28, None], [0x10, None],
+           [0x7e], [0x77], [0x23], [0x2b], [0x13], [0x1b], [0xe5], [0xe1], [0xd5], [0xd1], [0xc5], [0xc1],
+           [0xc9], [0xaf], [0xb7], [0x47], [0x78], [0x79], [0x4f], [0x19], [0x09], [0xeb],
+           [0xdd, 0x7e, None], [0xdd, 0x77, None], [0xfd, 0x36, None, None], [0xed, 0xb0], [0xcb, 0x3f]]
+
+
+### ---------------------------------------------------------------------------
+### load binary
+### ---------------------------------------------------------------------------
+def bin_load(file):
+    fil_bin = open(file, "rb")
+    binary = fil_bin.read()
+    fil_bin.close()
+    return binary
+
+
+### ---------------------------------------------------------------------------
+### synthetic Z80 code
+### ---------------------------------------------------------------------------
+# Code is built from a limited set of routines, which call each other, so it
+# repeats like real code does.
+def gen_code(rnd, length):
+    routines = []
+    for i in range(24):
+        routine = bytearray()
+        for j in range(rnd.randint(4, 24)):
+            routine += bytes(rnd.randrange(256) if byt is None else byt for byt in rnd.choice(Z80_OPS))
+        routines.append(routine + b"\xc9")
+
+    binary = bytearray()
+    while len(binary) < length:
+        routine = rnd.choice(routines)
+        if rnd.random() < 0.3:
+            routine = bytearray(routine)
+            routine[rnd.randrange(len(routine))] = rnd.randrange(256)
+        binary += routine
+    return binary[:length]
+
+
+### ---------------------------------------------------------------------------
+### synthetic data (texts, tables, empty buffers)
+### ---------------------------------------------------------------------------
+def gen_data(rnd, length):
+    words = [b"File", b"Edit", b"View", b"Help", b"Open", b"Save", b"Close", b"Cancel", b"OK", b"Window",
+             b"Desktop", b"Error", b"Disc", b"Memory", b"Print", b"Search", b"Options", b"About"]
+    binary = bytearray()
+    while len(binary) < length:
+        kind = rnd.random()
+        if kind < 0.4:
+            binary += b" ".join(rnd.choice(words) for i in range(rnd.randint(1, 4))) + b"\x00"
+        elif kind < 0.7:
+            binary += b"".join(struct.pack("<H", rnd.randrange(0x8000, 0x9000, 2)) for i in range(rnd.randint(2, 12)))
+        elif kind < 0.9:
+            binary += bytes(rnd.randint(8, 64))
+        else:
+            binary += bytes(rnd.randrange(256) for i in range(rnd.randint(4, 32)))
+    return binary[:length]
+
+
+### ---------------------------------------------------------------------------
+### SymExe10 executable
+### ---------------------------------------------------------------------------
+# icon = include 16 colour icon at the start of the data area
+def gen_exe(rnd, len_code, len_data, len_trns, icon=False, widget=False):
+    bin_code = gen_code(rnd, len_code - 256)
+    if widget:
+        bin_code[4] = 3
+    bin_data = gen_data(rnd, len_data)
+    if icon:
+        bin_data[:298] = bytes([12, 24, 24]) + bytes(rnd.choice([0x00, 0x11, 0x88, 0xff, 0x18]) for i in range(295))
+    bin_trns = gen_data(rnd, len_trns)
+
+    # relocation table: mostly short distances, some long jumps
+    adrs = []
+    adr = rnd.randint(1, 16)
+    while adr < len_code + len_data - 2:
+        adrs.append(adr)
+        adr += rnd.choice([2, 3, 3, 4, 5, 6, 8, 11, 16]) if rnd.random() < 0.85 else rnd.randint(17, 300)
+    bin_relc = b"".join(struct.pack("<H", adr) for adr in adrs)
+
+    bin_head = bytearray(256)
+    struct.pack_into("<HHH", bin_head, 0, len_code, len_data, len_trns)
+    struct.pack_into("<H", bin_head, 8, len(adrs))
+    bin_head[48:56] = b"SymExe10"
+    if icon:
+        bin_head[40] = 1
+        struct.pack_into("<H", bin_head, 41, len_code)
+    return bytes(bin_head + bin_code + bin_data + bin_trns + bin_relc)
+
+
+### ---------------------------------------------------------------------------
+### SYMHLP10 help file
+### ---------------------------------------------------------------------------
+def gen_hlp(rnd, chapters):
+    txt_words = b"the window desktop file menu click select open save close program system memory disc".split()
+    bin_chaps = []
+    bin_table = bytearray()
+    for i in range(chapters):
+        links = rnd.randint(0, 4)
+        bin_chap = bytearray([0, links])
+        for j in range(links):
+            bin_chap += struct.pack("<HH", rnd.randrange(chapters), rnd.randrange(256))
+        lines = []
+        for j in range(rnd.randint(3, 40)):
+            lines.append(b" ".join(rnd.choice(txt_words) for k in range(rnd.randint(2, 9))))
+        bin_chap += b"\r\n".join(lines)
+        bin_chaps.append(bin_chap)
+        bin_table += struct.pack("<HH", len(bin_chap), 0)
+    bin_extra = b"Benchmark\x00"
+    return b"SYMHLP10" + struct.pack("<HH", len(bin_table), len(bin_extra)) + bin_table + bin_extra + b"".join(bin_chaps)
+
+
+### ---------------------------------------------------------------------------
+### 4 colour graphic lines (4 pixels per byte)
+### ---------------------------------------------------------------------------
+def gen_pixels4(rnd, xbyte, ylen):
+    binary = bytearray()
+    for y in range(ylen):
+        if y % 4 == 0:
+            line = bytes(rnd.choice([0x00, 0x0f, 0xf0, 0xff, 0x88, 0x11]) for x in range(xbyte))
+        binary += line
+    return binary
+
+
+### ---------------------------------------------------------------------------
+### SGX graphic with simple and extended parts
+### ---------------------------------------------------------------------------
+def gen_sgx(rnd):
+    bin_sgx = bytearray()
+    bin_sgx += bytes([16, 64, 48]) + gen_pixels4(rnd, 16, 48)
+    bin_sgx += bytes([255, 0, 0])
+    bin_sgx += bytes([64, 5]) + struct.pack("<HHH", 80, 160, 100) + gen_pixels4(rnd, 80, 100)
+    bin_sgx += bytes([64, 0]) + struct.pack("<HHH", 40, 160, 64) + gen_pixels4(rnd, 40, 64)
+    return bytes(bin_sgx + bytes(3))
+
+
+### ---------------------------------------------------------------------------
+### SNA snapshot (kb = 64 or 128)
+### ---------------------------------------------------------------------------
+def gen_sna(rnd, kb):
+    bin_head = bytearray(256)
+    bin_head[0:8] = b"MV - SNA"
+    bin_head[16] = 1
+    bin_head[107] = kb
+    bin_mem = bytearray()
+    for i in range(kb // 16):
+        kind = rnd.random()
+        if kind < 0.5:
+            bin_mem += gen_code(rnd, 16384)
+        elif kind < 0.8:
+            bin_mem += gen_data(rnd, 16384)
+        else:
+            bin_mem += gen_pixels4(rnd, 64, 256)
+    return bytes(bin_head + bin_mem)
+
+
+### ---------------------------------------------------------------------------
+### uncompressed BMP with 4 or 8 bpp (SymbOS palette colours 0-15)
+### ---------------------------------------------------------------------------
+# lines_4 = number of lines at the top, which only use colours 0-3 (icons)
+def gen_bmp(rnd, xlen, ylen, bpp, colours=16, lines_4=0):
+    pixels = [[0] * xlen for y in range(ylen)]
+    for i in range(max(4, xlen * ylen // 256)):
+        xbeg = rnd.randrange(xlen)
+        ybeg = rnd.randrange(ylen)
+        colour = rnd.randrange(colours)
+        for y in range(ybeg, min(ylen, ybeg + rnd.randint(1, 24))):
+            for x in range(xbeg, min(xlen, xbeg + rnd.randint(1, 24))):
+                pixels[y][x] = colour % 4 if y < lines_4 else colour
+
+    bin_pixels = bytearray()
+    for line in reversed(pixels):
+        if bpp == 4:
+            bin_pixels += bytes(line[x] * 16 + line[x + 1] for x in range(0, xlen, 2))
+        else:
+            bin_pixels += bytes(line)
+
+    bin_pal = b"".join(bytes([grey, grey, grey, 0]) for grey in range(0, 256, 255 // ((1 << bpp) - 1)))
+    len_head = 14 + 40 + len(bin_pal)
+    bin_head = b"BM" + struct.pack("<IHHI", len_head + len(bin_pixels), 0, 0, len_head)
+    bin_head += struct.pack("<IiiHHIIiiII", 40, xlen, ylen, 1, bpp, 0, len(bin_pixels), 2835, 2835, 1 << bpp, 0)
+    return bin_head + bin_pal + bin_pixels
+
+
+### ---------------------------------------------------------------------------
+### create corpus and return stages
+### ---------------------------------------------------------------------------
+# stage = (name, script, arguments, input files); arguments of the compressors
+# get the additional options
+def gen_corpus(dir_corpus, seed):
+    rnd = random.Random(seed)
+    corpus = {
+        "a.exe":  gen_exe(rnd, 16384, 6000, 2000),
+        "b.exe":  gen_exe(rnd, 12000, 4000, 1000, icon=True),
+        "c.wdg":  gen_exe(rnd, 3000, 1200, 300, widget=True),
+        "a.hlp":  gen_hlp(rnd, 60),
+        "a.sgx":  gen_sgx(rnd),
+        "a.sna":  gen_sna(rnd, 64),
+        "b.sna":  gen_sna(rnd, 128),
+        "a.pt3":  gen_data(rnd, 8000),
+        "icon4.bmp":    gen_bmp(rnd, 24, 56, 4, lines_4=32),
+        "icon8.bmp":    gen_bmp(rnd, 24, 56, 8, lines_4=32),
+        "font.bmp":     gen_bmp(rnd, 128, 48, 4, 2),
+        "bitmap4.bmp":  gen_bmp(rnd, 160, 64, 4, 4),
+        "bitmap16.bmp": gen_bmp(rnd, 64, 32, 8),
+        "wallp4.bmp":   gen_bmp(rnd, 320, 200, 4, 4),
+        "wallp16.bmp":  gen_bmp(rnd, 512, 212, 4),
+    }
+    for file, binary in corpus.items():
+        with open(os.path.join(dir_corpus, file), "wb") as fil_bin:
+            fil_bin.write(binary)
+
+    return [("compress_exe",   "compress_exe.py",  ["*.exe", "*.wdg"],  ["a.exe", "b.exe", "c.wdg"]),
+            ("compress_hlp",   "compress_hlp.py",  ["a.hlp"],           ["a.hlp"]),
+            ("compress_sgx",   "compress_sgx.py",  ["a.sgx"],           ["a.sgx"]),
+            ("compress_sna64", "compress_sna.py",  ["a.sna"],           ["a.sna"]),
+            ("compress_sna128", "compress_sna.py", ["b.sna"],           ["b.sna"]),
+            ("compress_file",  "compress_file.py", ["a.pt3"],           ["a.pt3"]),
+            ("gfx_icon",       "gfx_icon.py",      ["icon*.bmp"],       ["icon4.bmp", "icon8.bmp"]),
+            ("gfx_font_raw",   "gfx_font_raw.py",  ["16", "6", "8", "32", "font.bmp"], ["font.bmp"]),
+            ("gfx_bitmap4",    "gfx_bitmap4.py",   ["bitmap4.bmp", "160", "64"], ["bitmap4.bmp"]),
+            ("gfx_bitmap16",   "gfx_bitmap16.py",  ["bitmap16.bmp", "64", "32"], ["bitmap16.bmp"]),
+            ("gfx_wallp4",     "gfx_wallp.py",     ["4", "wallp4.bmp"], ["wallp4.bmp"]),
+            ("gfx_wallp16",    "gfx_wallp.py",     ["16", "wallp16.bmp"], ["wallp16.bmp"])]
+
+
+### ---------------------------------------------------------------------------
+### run one stage
+### ---------------------------------------------------------------------------
+# returns time in seconds, bytes of the input and the output files and the
+# error message (None, if the script succeeded)
+def stage_run(dir_corpus, dir_work, script, args, files):
+    shutil.rmtree(dir_work, ignore_errors=True)
+    os.makedirs(dir_work)
+    for file in files:
+        shutil.copy(os.path.join(dir_corpus, file), dir_work)
+    files_org = {file: os.path.getsize(os.path.join(dir_work, file)) for file in files}
+
+    tim_start = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), script)] + args,
+                            cwd=dir_work, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    seconds = time.perf_counter() - tim_start
+
+    # output = new or changed files, without backups and indices
+    len_out = 0
+    for file in os.listdir(dir_work):
+        if file.endswith(".bak") or file.endswith(".idx") or file.endswith(".json"):
+            continue
+        if file not in files_org or bin_load(os.path.join(dir_work, file)) != bin_load(os.path.join(dir_corpus, file)):
+            len_out += os.path.getsize(os.path.join(dir_work, file))
+
+    error = None
+    if result.returncode != 0:
+        error = result.stderr.strip().split("\n")[-1]
+    return seconds, sum(files_org.values()), len_out, error
+
+
+### ---------------------------------------------------------------------------
+### compare results with a baseline
+### ---------------------------------------------------------------------------
+# returns the number of regressions
+def compare(results, baseline, threshold):
+    regressions = 0
+    print("")
+    print(f"{'stage':<16} {'baseline':>9} {'now':>9} {'change':>8}")
+    for name, result in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None or base["seconds"] is None or result["seconds"] is None:
+            print(f"{name:<16} {'-':>9} {'-':>9}")
+            continue
+        change = (result["seconds"] / base["seconds"] - 1) * 100
+        txt_line = f"{name:<16} {base['seconds']:>8.2f}s {result['seconds']:>8.2f}s {change:>+7.1f}%"
+        if change > threshold and max(result["seconds"], base["seconds"]) >= TIME_MIN:
+            txt_line += "  ## REGRESSION"
+            regressions += 1
+        if base["bytes_out"] != result["bytes_out"]:
+            txt_line += f"  (output {base['bytes_out']} -> {result['bytes_out']} bytes)"
+        print(txt_line)
+    if baseline.get("version") != results["version"] or baseline.get("seed") != results["seed"] or baseline.get("args") != results["args"]:
+        print("## baseline has been made with another corpus or other options")
+    return regressions
+
+
+### ---------------------------------------------------------------------------
+### run benchmark
+### ---------------------------------------------------------------------------
+def benchmark(options, dir_base):
+    dir_corpus = os.path.join(dir_base, "corpus")
+    os.makedirs(dir_corpus, exist_ok=True)
+    stages = gen_corpus(dir_corpus, options.seed)
+
+    results = {"version": BENCH_VERSION, "seed": options.seed, "args": options.args, "repeat": options.repeat,
+               "python": platform.python_version(), "stages": {}}
+    for name, script, args, files in stages:
+        if options.stage is not None and options.stage not in name:
+            continue
+        if script.startswith("compress_"):
+            args = args + options.args.split()
+
+        print(f"{name}..", end="", flush=True)
+        times = []
+        for i in range(options.repeat):
+            seconds, len_in, len_out, error = stage_run(dir_corpus, os.path.join(dir_base, name), script, args, files)
+            if error is not None:
+                break
+            times.append(seconds)
+        if error is not None:
+            print(f" ## ERROR ({error})")
+            results["stages"][name] = {"seconds": None, "bytes_in": len_in, "bytes_out": None, "error": error}
+            continue
+        print(f" {min(times):.2f}s, {len_in} -> {len_out} bytes")
+        results["stages"][name] = {"seconds": min(times), "bytes_in": len_in, "bytes_out": len_out}
+    return results
+
+
+### ---------------------------------------------------------------------------
+### main
+### ---------------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(prog="python3 benchmark.py")
+    parser.add_argument("--stage", metavar="TEXT", help="only run the stages, whose name contains TEXT")
+    parser.add_argument("--repeat", type=int, default=1, metavar="N", help="run every stage N times, the fastest run counts (default 1)")
+    parser.add_argument("--seed", type=int, default=1, metavar="N", help="random seed of the corpus (default 1)")
+    parser.add_argument("--args", default="", metavar="TEXT", help="additional options for the compressors")
+    parser.add_argument("--out", metavar="FILE", help="save the results as JSON in FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="compare the results with the ones in FILE")
+    parser.add_argument("--threshold", type=float, default=10, metavar="PCT", help="a stage more than PCT%% slower than the baseline is a regression (default 10)")
+    parser.add_argument("--keep", metavar="DIR", help="create the corpus and the outputs in DIR and keep them")
+    options = parser.parse_args()
+
+    if options.keep is not None:
+        os.makedirs(options.keep, exist_ok=True)
+        results = benchmark(options, options.keep)
+    else:
+        with tempfile.TemporaryDirectory(prefix="bench_") as dir_temp:
+            results = benchmark(options, dir_temp)
+
+    if options.out is not None:
+        with open(options.out, "w") as fil_json:
+            json.dump(results, fil_json, indent=2)
+
+    if options.baseline is not None:
+        with open(options.baseline) as fil_json:
+            baseline = json.load(fil_json)
+        regressions = compare(results, baseline, options.threshold)
+        print(f"{regressions} regressions (threshold {options.threshold:g}%)")
+        if regressions > 0:
+            sys.exit(1)
+
+
+### batch
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
-import subprocess
-import sys
-import glob
+import os
+import struct
+import compress_lib
 
 
 ### ===========================================================================
@@ -13,7 +13,36 @@ Saukas. Files can be EXE (executable), SAV (screen saver), WDG (desktop
 widget), COM (SymShell executable).
 
 usage:
-python3 compress_exe.py [filemask]
+python3 compress_exe.py [filemask] [options]
+
+options:
+--jobs N            compress N files in parallel (0 = one per CPU core)
+--zx0-exe PATH      use the ZX0 command line tool at PATH (default: -zx0 or zx0
+                    in the script directory or in PATH, if found)
+--in-process        use the in-process compressor, even if the tool is found
+--draft             compress fast, but not optimal (for development builds)
+--cache DIR         reuse compressed areas of unchanged data from DIR
+--cache-size MB     maximum size of the cache (default 64)
+--precheck PCT      don't compress areas with less than PCT% repeated 3-byte
+                    sequences and a high byte entropy (default 1, 0 = off)
+--unpack-time       report estimated load and unpack time of each area
+--load-budget PCT   keep areas uncompressed, which load slower than PCT% of
+                    the uncompressed time
+--disk-speed KB/s   disk throughput for load times (default 20)
+--cpu-mhz MHZ       Z80 clock for unpack times (default 4)
+--stats-json FILE   save times and sizes of every stage, file and area as JSON
+--verify            unpack compressed files and compare them with the .bak
+                    originals instead of compressing
+--race size|time    try several variants of each area and keep the smallest
+                    (size) or the fastest loading one (time)
+
+With --race every area is compressed in optimal and in quick mode, each with
+the uncompressed prefix (icon, widget or saver header) as required and moved
+256 and 1024 bytes further into the area. All variants are compressed in
+parallel (with --jobs), the winner is reported for every area. Ties are
+broken by the other objective. With --draft the greedy parser (or the quick
+mode of the ZX0 tool) is used instead, and variants, which would give the
+same result, are compressed only once.
 """
 
 
@@ -24,13 +53,7 @@ HD_FUL_RELC =  8  # Size of the relocator table (=total size/2)
 HD_FLAGS    = 40  # Flags (+1=16 colour icon included, +2=packed reloc table, +128=compressed code, +64=compressed data, +32=compressed transfer, +16=compressed reloc)
 HD_ICONOFS  = 41  # 16 colour icon offset in file
 
-
-### ---------------------------------------------------------------------------
-### execute shell command
-### ---------------------------------------------------------------------------
-def run_cmd(cmd):
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-    c = p.communicate()
+RACE_SPLITS = [0, 256, 1024]    # --race moves the uncompressed prefix by these bytes
 
 
 ### ---------------------------------------------------------------------------
@@ -81,80 +104,146 @@ def word_bin(word):
 def compress_area(name, uncompressed, binary):
 
     print(name + "..")
-
-    if len(binary) > 8 and uncompressed > -1:
+    if len(binary) > 8 and uncompressed > -1 and uncompressed < len(binary) - 4 and compress_lib.compressible(binary[uncompressed:]):
     
-        # create and compress file
-        bin_save("temp", binary[:len(binary)-4])
-
-        if uncompressed == 0:
-            run_cmd("-zx0 temp")
-        else:
-            run_cmd(f"-zx0 +{uncompressed} temp")
+        # compress area, uncompressed part stays in front
+        bin_zx0 = compress_lib.zx0_compress(binary[:len(binary)-4], uncompressed)
+        tim_unpack = compress_lib.unpack_time(bin_zx0, 4 + uncompressed)
     
-        # load compressed data and remove temps
-        bin_crn = bin_load("temp.zx0")
-        run_cmd("del temp")
-        run_cmd("del temp.zx0")
-    
-        bin_crn = binary[len(binary)-4:] + word_bin(uncompressed) + binary[:uncompressed] + bin_crn
+        bin_crn = binary[len(binary)-4:] + word_bin(uncompressed) + binary[:uncompressed] + bin_zx0
         bin_crn = word_bin(len(bin_crn)) + bin_crn
 
-        if len(bin_crn) < len(binary):
+        if len(bin_crn) < len(binary) and compress_lib.unpack_check(len(binary), len(bin_crn), tim_unpack):
             return bin_crn, True
 
     return binary, False
      
 
 ### ---------------------------------------------------------------------------
-### adds nibble
+### add command line options
 ### ---------------------------------------------------------------------------
-def nibble_add(nibble_last, nibble_new, adr_fix):
-    if nibble_last > -1:
-        binary = bytearray([nibble_last + nibble_new * 16]) + adr_fix
-        adr_fix = bytearray(0)
-        nibble_last = -1
-    else:
-        nibble_last = nibble_new
-        binary = bytearray(0)
-    return binary, nibble_last, adr_fix
+def arg_add(parser):
+    parser.add_argument("--race", choices=["size", "time"], help="try several variants of each area and keep the smallest or fastest loading one")
+
 
+### ---------------------------------------------------------------------------
+### get race variants (uncompressed prefix, quick mode) of one area
+### ---------------------------------------------------------------------------
+def race_variants(uncompressed, binary):
+    if len(binary) <= 8 or uncompressed < 0 or uncompressed >= len(binary) - 4 or not compress_lib.compressible(binary[uncompressed:]):
+        return []
+    modes = []
+    for quick in (False, True):
+        if compress_lib.zx0_mode(quick) not in modes:
+            modes.append(compress_lib.zx0_mode(quick))
+    return [(uncompressed + split, quick) for split in RACE_SPLITS if uncompressed + split < len(binary) - 4 for quick, greedy in modes]
+
+
+### ---------------------------------------------------------------------------
+### get name of the ZX0 mode, which is used for a race variant
+### ---------------------------------------------------------------------------
+def mode_name(quick):
+    quick, greedy = compress_lib.zx0_mode(quick)
+    if greedy:
+        return "greedy, quick" if quick else "greedy"
+    return "quick" if quick else "optimal"
+
+
+### ---------------------------------------------------------------------------
+### compress one race variant of an area
+### ---------------------------------------------------------------------------
+# returns compressed area and estimated unpack time
+def compress_variant(binary, uncompressed, quick):
+    bin_zx0 = compress_lib.zx0_compress(binary[:len(binary)-4], uncompressed, quick)
+    bin_crn = binary[len(binary)-4:] + word_bin(uncompressed) + binary[:uncompressed] + bin_zx0
+    return word_bin(len(bin_crn)) + bin_crn, compress_lib.unpack_time(bin_zx0, 4 + uncompressed, True)
+
+
+### ---------------------------------------------------------------------------
+### compress areas with all race variants and keep the best ones
+### ---------------------------------------------------------------------------
+def race_areas(areas):
+    options = compress_lib.options
+    variants = [race_variants(uncompressed, binary) for name, uncompressed, binary in areas]
+    results = iter(compress_lib.area_map(compress_variant, [(binary, uncompressed, quick) for (name, unc_req, binary), area_variants in zip(areas, variants) for uncompressed, quick in area_variants]))
+
+    areas_out = []
+    for (name, unc_req, binary), area_variants in zip(areas, variants):
+        print(name + "..")
+
+        # stored uncompressed, if nothing is better
+        len_best = len(binary)
+        tim_best = compress_lib.load_time(len_best)
+        best = (binary, False)
+        txt_best = "uncompressed"
+        for uncompressed, quick in area_variants:
+            bin_crn, tim_unpack = next(results)
+            tim_load = compress_lib.load_time(len(bin_crn)) + tim_unpack
+            if options.race == "size":
+                better = (len(bin_crn), tim_load) < (len_best, tim_best)
+            else:
+                better = (tim_load, len(bin_crn)) < (tim_best, len_best)
+            if better:
+                len_best = len(bin_crn)
+                tim_best = tim_load
+                best = (bin_crn, True)
+                tim_unpack_best = tim_unpack
+                txt_best = f"{mode_name(quick)}, prefix {uncompressed}"
+
+        if len(area_variants) > 0:
+            print(f"  race: {txt_best} -> {len_best} bytes, load {tim_best:.1f}ms (best of {len(area_variants) + 1})")
+        if best[1] and not compress_lib.unpack_check(len(binary), len_best, tim_unpack_best):
+            best = (binary, False)
+        areas_out.append(best)
+    return areas_out
 
 
 ### ---------------------------------------------------------------------------
 ### pack relocator table
 ### ---------------------------------------------------------------------------
+# Every address is stored as a nibble with its distance to the previous one
+# (distance - 1), two nibbles per byte. Distances above 16 get nibble 0 and the
+# full address follows the byte. A full address of 0 ends the table.
 def pack_reloc(binary):
 
-    bin_reloc = bytearray(0)
-    adr_last = -99999
-    adr_fix = bytearray(0)
-    nibble_last = -1
-
-    for i in range(0, len(binary), 2):
-        adr_new = word_get(binary[i:i+2])
-        adr_dif = adr_new - adr_last
-        if adr_dif < 2:
-            print("## RELOC ERROR (DIF " + str(adr_dif) + ") AT " + str(i))
-        if adr_dif > 16:
-            nibble_new = 0
-            adr_fix += binary[i:i+2]
-        else:
-            nibble_new = adr_dif - 1
+    count = int(len(binary) / 2)
+    adrs = struct.unpack_from(f"<{count}H", binary)
+    adr_difs = [adr_new - adr_last for adr_last, adr_new in zip((-99999,) + adrs, adrs)]
 
-        bin_add, nibble_last, adr_fix = nibble_add(nibble_last, nibble_new, adr_fix)
-        bin_reloc += bin_add
+    for i in range(count):
+        if adr_difs[i] < 2:
+            print("## RELOC ERROR (DIF " + str(adr_difs[i]) + ") AT " + str(i * 2))
+    nibbles = [0 if adr_dif > 16 else adr_dif - 1 for adr_dif in adr_difs]
+    len_fix = 2 * sum(adr_dif > 16 for adr_dif in adr_difs)
 
-        adr_last = adr_new
+    # buffer for nibble bytes, full addresses and end marker
+    bin_reloc = bytearray(int(count / 2) + len_fix + 4)
+    adr = 0
+    nibble_last = -1
+    fix_first = 0       # first entry, whose full address is not written yet
+    for i in range(count):
+        if nibble_last > -1:
+            bin_reloc[adr] = nibble_last + nibbles[i] * 16
+            adr += 1
+            for j in range(fix_first, i + 1):
+                if adr_difs[j] > 16:
+                    bin_reloc[adr:adr + 2] = binary[j * 2:j * 2 + 2]
+                    adr += 2
+            fix_first = i + 1
+            nibble_last = -1
+        else:
+            nibble_last = nibbles[i]
 
+    # end marker (nibble 0 with full address 0), which stays 0 in the buffer
     if nibble_last > -1:
-        adr_fix += bytearray(2)
-        bin_add, nibble_last, adr_fix = nibble_add(nibble_last, 0, adr_fix)
-        bin_reloc += bin_add
-    else:
-        bin_reloc += bytearray(3)
-
-    bin_reloc += bytearray(len(bin_reloc) % 2)      # align to 2
+        bin_reloc[adr] = nibble_last
+        adr += 1
+    for j in range(fix_first, count):
+        if adr_difs[j] > 16:
+            bin_reloc[adr:adr + 2] = binary[j * 2:j * 2 + 2]
+            adr += 2
+    adr += 2 if nibble_last > -1 else 3
+    del bin_reloc[adr + adr % 2:]                           # align to 2
 
     if len(bin_reloc) < len(binary):
         return bin_reloc, 2
@@ -162,6 +251,30 @@ def pack_reloc(binary):
         return binary, 0
 
 
+### ---------------------------------------------------------------------------
+### unpack relocator table
+### ---------------------------------------------------------------------------
+def unpack_reloc(binary):
+
+    bin_reloc = bytearray(0)
+    adr_last = -99999
+    adr = 0
+
+    while True:
+        nibbles = binary[adr]
+        adr += 1
+        for nibble_new in (nibbles % 16, int(nibbles / 16)):
+            if nibble_new == 0:
+                adr_new = word_get(binary[adr:adr+2])
+                adr += 2
+                if adr_new == 0:
+                    return bin_reloc
+            else:
+                adr_new = adr_last + nibble_new + 1
+            bin_reloc += word_bin(adr_new)
+            adr_last = adr_new
+
+
 ### ---------------------------------------------------------------------------
 ### compress one EXE file
 ### ---------------------------------------------------------------------------
@@ -172,7 +285,8 @@ def compress_exe(file):
     fil_ext = file[len(file) - 3:].lower()
 
     # load exe
-    bin_exe = bin_load(file)
+    with compress_lib.stage("load"):
+        bin_exe = bin_load(file)
 
     exeid = bytearray()
     exeid.extend("SymExe10".encode())
@@ -213,40 +327,86 @@ def compress_exe(file):
             else:
                 unc_trns = -1
 
-    # compress areas
-    bin_code, flg_code = compress_area("code", unc_code, bin_exe[256:                len_code])
-    bin_data, flg_data = compress_area("data", unc_data, bin_exe[len_code:           len_code + len_data])
-    bin_trns, flg_trns = compress_area("trns", unc_trns, bin_exe[len_code + len_data:len_code + len_data + len_trns])
-    bin_relc, flg_relp = pack_reloc(bin_exe[len_code + len_data + len_trns:])
-    len_relc = len(bin_relc)
-    bin_relc, flg_relc = compress_area("relc", 0, bin_relc)
+    # compress areas (in parallel, if possible)
+    with compress_lib.stage("parse"):
+        bin_relc, flg_relp = pack_reloc(bin_exe[len_code + len_data + len_trns:])
+        len_relc = len(bin_relc)
+        areas = [("code", unc_code, bin_exe[256:                len_code]),
+                 ("data", unc_data, bin_exe[len_code:           len_code + len_data]),
+                 ("trns", unc_trns, bin_exe[len_code + len_data:len_code + len_data + len_trns]),
+                 ("relc", 0,        bin_relc)]
+    if compress_lib.options.race is None:
+        areas_crn = compress_lib.area_map(compress_area, areas)
+    else:
+        areas_crn = race_areas(areas)
+    [(bin_code, flg_code), (bin_data, flg_data), (bin_trns, flg_trns), (bin_relc, flg_relc)] = areas_crn
+    for (name, uncompressed, binary), (bin_crn, flg_crn) in zip(areas, areas_crn):
+        compress_lib.metrics_area(name, len(binary), len(bin_crn))
 
     # update header
-    bin_head = bytearray(bin_exe[:256])
-    flags = int(bin_head[HD_FLAGS])
-    if flg_code: flags += 128
-    if flg_data: flags += 64
-    if flg_trns: flags += 32
-    if flg_relc: flags += 16
-    if flg_relp: flags += 2
-    bin_head[HD_FLAGS] = flags
-
-    word_set(True, bin_head, HD_FUL_RELC, int(len_relc / 2))
+    with compress_lib.stage("assemble"):
+        bin_head = bytearray(bin_exe[:256])
+        flags = int(bin_head[HD_FLAGS])
+        if flg_code: flags += 128
+        if flg_data: flags += 64
+        if flg_trns: flags += 32
+        if flg_relc: flags += 16
+        if flg_relp: flags += 2
+        bin_head[HD_FLAGS] = flags
+
+        word_set(True, bin_head, HD_FUL_RELC, int(len_relc / 2))
+        bin_out = bin_head + bin_code + bin_data + bin_trns + bin_relc
 
     # save compressed exe
-    run_cmd(f"ren {file} {file}.bak")
-    bin_save(file, bin_head + bin_code + bin_data + bin_trns + bin_relc)
+    with compress_lib.stage("save"):
+        os.replace(file, file + ".bak")
+        bin_save(file, bin_out)
 
     len_org = len(bin_exe)
-    len_crn = len(bin_head) + len(bin_code) + len(bin_data) + len(bin_trns) + len(bin_relc)
+    len_crn = len(bin_out)
+    compress_lib.metrics_file(len_org, len_crn)
     print(f"DONE! compressed from {len_org} to {len_crn} ({len_crn/len_org*100:.0f}%)")
     print("")
 
 
+### ---------------------------------------------------------------------------
+### unpack one compressed EXE file
+### ---------------------------------------------------------------------------
+def decompress_exe(bin_exe):
+
+    bin_head = bytearray(bin_exe[:256])
+    flags = int(bin_head[HD_FLAGS])
+
+    len_code = word_get(bin_head[HD_FUL_CODE:HD_FUL_CODE + 2])
+    len_data = word_get(bin_head[HD_FUL_DATA:HD_FUL_DATA + 2])
+    len_trns = word_get(bin_head[HD_FUL_TRNS:HD_FUL_TRNS + 2])
+    len_relc = word_get(bin_head[HD_FUL_RELC:HD_FUL_RELC + 2]) * 2
+
+    # areas
+    bin_out = bytearray()
+    adr = 256
+    for len_area, flag in ((len_code - 256, 128), (len_data, 64), (len_trns, 32), (len_relc, 16)):
+        if flags & flag:
+            len_area = word_get(bin_exe[adr:adr + 2])
+            bin_area = compress_lib.area_unpack(bin_exe[adr + 2:adr + 2 + len_area])
+            adr += 2
+        else:
+            bin_area = bin_exe[adr:adr + len_area]
+        adr += len_area
+        bin_out += bin_area
+
+    # relocator table
+    if flags & 2:
+        bin_relc = unpack_reloc(bin_area)
+        bin_out[len(bin_out) - len(bin_area):] = bin_relc
+        word_set(True, bin_head, HD_FUL_RELC, int(len(bin_relc) / 2))
+        flags -= 2
+
+    bin_head[HD_FLAGS] = flags & 15
+    return bin_head + bin_out
+
+
 ### batch
-files = glob.glob(sys.argv[1])
-if len(files) == 0:
-    print("File(s) not found")
-else:
-    for file in files:
-        compress_exe(file)
+if __name__ == "__main__":
+    compress_lib.main(compress_exe, "compress_exe.py", "EXE, SAV, WDG, COM", decompress_exe, arg_add)
+
@@ -1,6 +1,5 @@
-import subprocess
-import sys
-import glob
+import os
+import compress_lib
 
 
 ### ===========================================================================
@@ -19,18 +18,27 @@ This can be done for the following music files:
 Attention: Compressed files can't be loaded with other tools anymore!
 
 usage:
-python3 compress_file.py [filemask]
+python3 compress_file.py [filemask] [options]
+
+options:
+--jobs N            compress N files in parallel (0 = one per CPU core)
+--zx0-exe PATH      use the ZX0 command line tool at PATH (default: -zx0 or zx0
+                    in the script directory or in PATH, if found)
+--in-process        use the in-process compressor, even if the tool is found
+--draft             compress fast, but not optimal (for development builds)
+--cache DIR         reuse compressed areas of unchanged data from DIR
+--cache-size MB     maximum size of the cache (default 64)
+--unpack-time       report estimated load and unpack time of each area
+--load-budget PCT   keep areas uncompressed, which load slower than PCT% of
+                    the uncompressed time
+--disk-speed KB/s   disk throughput for load times (default 20)
+--cpu-mhz MHZ       Z80 clock for unpack times (default 4)
+--stats-json FILE   save times and sizes of every stage, file and area as JSON
+--verify            unpack compressed files and compare them with the .bak
+                    originals instead of compressing
 """
 
 
-### ---------------------------------------------------------------------------
-### execute shell command
-### ---------------------------------------------------------------------------
-def run_cmd(cmd):
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-    c = p.communicate()
-
-
 ### ---------------------------------------------------------------------------
 ### load binary
 ### ---------------------------------------------------------------------------
@@ -50,6 +58,13 @@ def bin_save(file, binary):
     fil_bin.close()
 
 
+### ---------------------------------------------------------------------------
+### get word from binary
+### ---------------------------------------------------------------------------
+def word_get(binary):
+    return binary[0] + 256 * binary[1]
+
+
 ### ---------------------------------------------------------------------------
 ### return word as binary
 ### ---------------------------------------------------------------------------
@@ -61,13 +76,9 @@ def word_bin(word):
 ### compress data
 ### ---------------------------------------------------------------------------
 def compress(binary):
-    bin_save("temp", binary[:len(binary) - 4])
-    run_cmd("-zx0 temp")
-    bin_crn = bin_load("temp.zx0")
-    run_cmd("del temp")
-    run_cmd("del temp.zx0")
-    bin_crn = binary[len(binary) - 4:] + bytearray(2) + bin_crn
-    return word_bin(len(bin_crn)) + bin_crn
+    bin_zx0 = compress_lib.zx0_compress(binary[:len(binary) - 4])
+    bin_crn = binary[len(binary) - 4:] + bytearray(2) + bin_zx0
+    return word_bin(len(bin_crn)) + bin_crn, compress_lib.unpack_time(bin_zx0)
 
 
 ### ---------------------------------------------------------------------------
@@ -78,7 +89,8 @@ def compress_file(file):
     print("Compressing " + file.upper() + "...")
     
     # load file
-    binary = bin_load(file)
+    with compress_lib.stage("load"):
+        binary = bin_load(file)
 
     bin_out = bytearray()
     bin_out.extend("SymZX0".encode())
@@ -88,21 +100,36 @@ def compress_file(file):
         return
 
     len_org = len(binary)
-    bin_out += word_bin(len_org) + compress(binary)
+    bin_crn, tim_unpack = compress(binary)
+    bin_out += word_bin(len_org) + bin_crn
+    compress_lib.metrics_area("file", len_org, len(bin_crn))
+    if not compress_lib.unpack_check(len_org, len(bin_out), tim_unpack):
+        print("File not compressed (load time budget)")
+        print("")
+        return
 
     # save compressed file
-    run_cmd(f"ren {file} {file}.bak")
-    bin_save(file, bin_out)
+    with compress_lib.stage("save"):
+        os.replace(file, file + ".bak")
+        bin_save(file, bin_out)
 
     len_crn = len(bin_out)
+    compress_lib.metrics_file(len_org, len_crn)
     print(f"DONE! compressed from {len_org} to {len_crn} ({len_crn/len_org*100:.0f}%)")
     print("")
 
 
+### ---------------------------------------------------------------------------
+### unpack one compressed general file
+### ---------------------------------------------------------------------------
+def decompress_file(binary):
+    if binary[:6] != "SymZX0".encode():
+        raise ValueError("not compressed")
+    len_crn = word_get(binary[8:10])
+    return compress_lib.area_unpack(binary[10:10 + len_crn])
+
+
 ### batch
-files = glob.glob(sys.argv[1])
-if len(files) == 0:
-    print("File(s) not found")
-else:
-    for file in files:
-        compress_file(file)
+if __name__ == "__main__":
+    compress_lib.main(compress_file, "compress_file.py", "ST2, SKM, PT3, SA2", decompress_file)
+
@@ -1,6 +1,6 @@
-import subprocess
-import sys
-import glob
+import hashlib
+import os
+import compress_lib
 
 
 ### ===========================================================================
@@ -12,16 +12,36 @@ Compresses multiple HLP files (SymbOS help file browser), using the ZX0
 compressor by Einar Saukas.
 
 usage:
-python3 compress_exe.py [filemask].hlp
+python3 compress_hlp.py [filemask].hlp [options]
+
+options:
+--jobs N            compress N files in parallel (0 = one per CPU core)
+--zx0-exe PATH      use the ZX0 command line tool at PATH (default: -zx0 or zx0
+                    in the script directory or in PATH, if found)
+--in-process        use the in-process compressor, even if the tool is found
+--draft             compress fast, but not optimal (for development builds)
+--cache DIR         reuse compressed areas of unchanged data from DIR
+--cache-size MB     maximum size of the cache (default 64)
+--precheck PCT      don't compress areas with less than PCT% repeated 3-byte
+                    sequences and a high byte entropy (default 1, 0 = off)
+--unpack-time       report estimated load and unpack time of each area
+--load-budget PCT   keep areas uncompressed, which load slower than PCT% of
+                    the uncompressed time
+--disk-speed KB/s   disk throughput for load times (default 20)
+--cpu-mhz MHZ       Z80 clock for unpack times (default 4)
+--stats-json FILE   save times and sizes of every stage, file and area as JSON
+--verify            unpack compressed files and compare them with the .bak
+                    originals instead of compressing
+--incremental       only compress new or changed chapters, take the others
+                    from the index file [file].idx of the last build
+
+The index file contains a fingerprint and the compressed data of each chapter.
+Fingerprints include the compressor version and the options which change the
+compressed data, so chapters are compressed again after changing them.
 """
 
 
-### ---------------------------------------------------------------------------
-### execute shell command
-### ---------------------------------------------------------------------------
-def run_cmd(cmd):
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-    c = p.communicate()
+IDX_ID = "SYMHLPIX"     # id of the index file
 
 
 ### ---------------------------------------------------------------------------
@@ -60,19 +80,66 @@ def word_bin(word):
 ### ---------------------------------------------------------------------------
 ### compress help chapter
 ### ---------------------------------------------------------------------------
-def compress(binary):
-    if len(binary) > 2 + 2 + 4 + 1:
-        bin_save("temp", binary[:len(binary) - 4])
-        run_cmd("-zx0 temp")
-        bin_crn = bin_load("temp.zx0")
-        run_cmd("del temp")
-        run_cmd("del temp.zx0")
-        bin_crn = binary[len(binary) - 4:] + bytearray(2) + bin_crn
-        if (len(bin_crn) + 2) < len(binary):
+def compress(binary, name):
+    if len(binary) > 2 + 2 + 4 + 1 and compress_lib.compressible(binary):
+        bin_zx0 = compress_lib.zx0_compress(binary[:len(binary) - 4])
+        tim_unpack = compress_lib.unpack_time(bin_zx0)
+        bin_crn = binary[len(binary) - 4:] + bytearray(2) + bin_zx0
+        if (len(bin_crn) + 2) < len(binary) and compress_lib.unpack_check(len(binary), len(bin_crn) + 2, tim_unpack, name):
             return word_bin(len(bin_crn)) + bin_crn, 128
     return binary, 0
 
 
+### ---------------------------------------------------------------------------
+### add HLP options to command line parser
+### ---------------------------------------------------------------------------
+def arg_add(parser):
+    parser.add_argument("--incremental", action="store_true", help="only compress new or changed chapters, reuse the others from [file].idx")
+
+
+### ---------------------------------------------------------------------------
+### get fingerprint of a chapter
+### ---------------------------------------------------------------------------
+def chapter_key(binary):
+    options = compress_lib.options
+    quick, greedy = compress_lib.zx0_mode()
+    key = hashlib.sha256(f"{compress_lib.CACHE_VERSION} {options.precheck} {options.load_budget} {options.disk_speed} {options.cpu_mhz}{' -q' if quick else ''}{' greedy' if greedy else ''}\n".encode())
+    key.update(binary)
+    return key.digest()
+
+
+### ---------------------------------------------------------------------------
+### load index file (fingerprint, flag, length and data of every chapter)
+### ---------------------------------------------------------------------------
+def index_load(file):
+    index = {}
+    try:
+        binary = bin_load(file)
+    except OSError:
+        return index
+    if binary[:8] != IDX_ID.encode():
+        return index
+
+    adr = 8
+    while adr + 35 <= len(binary):
+        len_crn = word_get(binary[adr + 33:adr + 35])
+        index[binary[adr:adr + 32]] = (bytearray(binary[adr + 35:adr + 35 + len_crn]), binary[adr + 32])
+        adr += 35 + len_crn
+    return index
+
+
+### ---------------------------------------------------------------------------
+### save index file
+### ---------------------------------------------------------------------------
+def index_save(file, index):
+    binary = bytearray(IDX_ID.encode())
+    for key in index:
+        crn_chap, crn_flag = index[key]
+        binary += key + bytearray([crn_flag]) + word_bin(len(crn_chap)) + crn_chap
+    bin_save(file + ".tmp", binary)
+    os.replace(file + ".tmp", file)
+
+
 ### ---------------------------------------------------------------------------
 ### compress one HLP file
 ### ---------------------------------------------------------------------------
@@ -83,7 +150,8 @@ def compress_hlp(file):
     bin_out = bytearray()
 
     # load hlp
-    binary = bytearray(bin_load(file))
+    with compress_lib.stage("load"):
+        binary = bytearray(bin_load(file))
     hlpid = bytearray()
     hlpid.extend("SYMHLP10".encode())
     if binary[:8] != hlpid:
@@ -96,39 +164,95 @@ def compress_hlp(file):
 
     len_head = 8 + 2 + 2 + word_get(binary[8:10]) + word_get(binary[10:12])
 
+    # get chapters
+    with compress_lib.stage("parse"):
+        chapters = []
+        adr = len_head
+        for i in range(int(word_get(binary[8:10])/4)):
+            len_chap = word_get(binary[12 + i * 4:14 + i *4]) & 8191
+            bin_chap = binary[adr:adr + len_chap]
+            hed_chap = bin_chap[:2 + bin_chap[1] * 4]
+            if int(hed_chap[0]) >= 128:
+                print("File already compressed")
+                print("")
+                return
+            chapters.append((hed_chap, bin_chap[len(hed_chap):]))
+
+            adr += len_chap
+
+    # compress chapters (in parallel, if possible), which are not in the index
+    incremental = compress_lib.options is not None and compress_lib.options.incremental
+    if incremental:
+        with compress_lib.stage("load"):
+            index = index_load(file + ".idx")
+        keys = [chapter_key(org_chap) for hed_chap, org_chap in chapters]
+    else:
+        index = {}
+        keys = list(range(len(chapters)))
+    changed = [i for i in range(len(chapters)) if keys[i] not in index]
+    chapters_crn = [index.get(key) for key in keys]
+    for i, chapter_crn in zip(changed, compress_lib.area_map(compress, [(chapters[i][1], f"chapter {i + 1}") for i in changed])):
+        chapters_crn[i] = chapter_crn
+    if incremental:
+        with compress_lib.stage("save"):
+            index_save(file + ".idx", dict(zip(keys, chapters_crn)))
+        print(f"{len(chapters) - len(changed)} of {len(chapters)} chapters unchanged")
+
+    # put chapters together again
+    with compress_lib.stage("assemble"):
+        for i in range(len(chapters)):
+            hed_chap = chapters[i][0]
+            crn_chap, crn_flag = chapters_crn[i]
+            col_flag = word_get(binary[12 + i * 4:14 + i *4]) & 8192
+            compress_lib.metrics_area(f"chapter {i + 1}", len(chapters[i][1]), len(crn_chap))
+
+            binary[12 + i * 4:14 + i *4] = word_bin(col_flag + len(hed_chap) + len(crn_chap))
+            hed_chap[0] = int(hed_chap[0]) + crn_flag
+            bin_out += hed_chap + crn_chap
+
+        bin_out = binary[:len_head] + bin_out
+
+    # save compressed hlp
+    with compress_lib.stage("save"):
+        os.replace(file, file + ".bak")
+        bin_save(file, bin_out)
+
+    len_crn = len(bin_out)
+    compress_lib.metrics_file(len_org, len_crn)
+    print(f"DONE! compressed from {len_org} to {len_crn} ({len_crn/len_org*100:.0f}%)")
+    print("")
+
+
+### ---------------------------------------------------------------------------
+### unpack one compressed HLP file
+### ---------------------------------------------------------------------------
+def decompress_hlp(binary):
+
+    binary = bytearray(binary)
+    bin_out = bytearray()
+
+    len_head = 8 + 2 + 2 + word_get(binary[8:10]) + word_get(binary[10:12])
+
     adr = len_head
     for i in range(int(word_get(binary[8:10])/4)):
         len_chap = word_get(binary[12 + i * 4:14 + i *4]) & 8191
         bin_chap = binary[adr:adr + len_chap]
         hed_chap = bin_chap[:2 + bin_chap[1] * 4]
-        if int(hed_chap[0]) >= 128:
-            print("File already compressed")
-            print("")
-            return
         org_chap = bin_chap[len(hed_chap):]
-        crn_chap, crn_flag = compress(org_chap)
+        if int(hed_chap[0]) >= 128:
+            hed_chap[0] = int(hed_chap[0]) - 128
+            org_chap = compress_lib.area_unpack(org_chap[2:2 + word_get(org_chap[:2])])
         col_flag = word_get(binary[12 + i * 4:14 + i *4]) & 8192
 
-        binary[12 + i * 4:14 + i *4] = word_bin(col_flag + len(hed_chap) + len(crn_chap))
-        hed_chap[0] = int(hed_chap[0]) + crn_flag
-        bin_out += hed_chap + crn_chap
+        binary[12 + i * 4:14 + i *4] = word_bin(col_flag + len(hed_chap) + len(org_chap))
+        bin_out += hed_chap + org_chap
 
         adr += len_chap
 
-    bin_out = binary[:len_head] + bin_out
-
-    # save compressed hlp
-    bin_save(file, bin_out)
-
-    len_crn = len(bin_out)
-    print(f"DONE! compressed from {len_org} to {len_crn} ({len_crn/len_org*100:.0f}%)")
-    print("")
+    return binary[:len_head] + bin_out
 
 
 ### batch
-files = glob.glob(sys.argv[1])
-if len(files) == 0:
-    print("File(s) not found")
-else:
-    for file in files:
-        compress_hlp(file)
+if __name__ == "__main__":
+    compress_lib.main(compress_hlp, "compress_hlp.py", "HLP", decompress_hlp, arg_add)
+
@@ -0,0 +1,660 @@
+import argparse
+import asyncio
+import collections
+import contextlib
+import functools
+import glob
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import zx0
+
+
+### ===========================================================================
+### SHARED BATCH FUNCTIONS FOR THE COMPRESS_* SCRIPTS
+### ===========================================================================
+
+"""
+Command line handling, batch processing and the ZX0 compression cache used by
+all compress_* scripts.
+
+With --jobs N the files are compressed by N worker processes; the console
+output of each file is collected in its worker and printed in the original
+file order, so the log looks the same as with a single process.
+If there is only one file, the N processes are used for its areas instead.
+
+With --cache DIR every compressed area is stored in DIR, using a hash of the
+uncompressed data and the uncompressed-prefix length as its name. Unchanged
+areas are taken from there on the next run instead of compressing them again.
+After each batch the least recently used entries are removed, until the cache
+fits into --cache-size MB.
+
+By default the areas are compressed with the ZX0 command line tool, if it is
+found (-zx0 or zx0 in the script directory or in PATH), as it is much faster
+than the in-process compressor (zx0.py), which is used otherwise or with
+--in-process. With --zx0-exe PATH the tool at PATH is used. The tool is
+started directly (without a shell) once per area, with the data in a private
+temp directory, which is removed afterwards. It has to create the same
+output as ZX0 v2.2, so the result doesn't depend on the compressor.
+In this case all files and areas are handled by threads, and the tool
+processes of all of them are started by one asyncio event loop, which keeps
+at most --jobs N of them running at the same time (default: one per CPU
+core). So loading, preparing and assembling of other files and areas goes on
+while the tool is running. The console output is still printed in file and
+area order.
+
+With --draft the areas are compressed with a greedy parser instead of the
+optimal one (with the ZX0 tool: in its quick mode). This is much
+faster, but the areas get bigger, so it's meant for development builds. The
+output is still valid ZX0 data.
+
+With --unpack-time the Z80 T-states of the standard ZX0 decompressor are
+counted for every area and reported as milliseconds at --cpu-mhz, together
+with the load time (disk read at --disk-speed KB/s plus decompression).
+With --load-budget PCT an area is only stored compressed, if its load time
+is at most PCT percent of the load time of the uncompressed area (where the
+file format allows uncompressed areas).
+
+Before an area is compressed, its byte entropy and the share of repeated
+3-byte sequences are checked. Areas with an entropy above ENTROPY_MIN and less
+than --precheck PCT percent repeated sequences (already packed graphics,
+samples or compressed data) are stored uncompressed without running ZX0.
+
+With --stats-json FILE the time of every stage (load, parse, precheck, zx0,
+unpack_time, assemble, save), the size of every area before and after the
+compression and the cache and precheck counts are saved as JSON in FILE, for
+every file and summed up for the whole batch. The zx0 time is the time spent
+in the compressor (for cache misses), summed up over all worker processes.
+
+With --verify nothing is compressed. Instead every given file is unpacked and
+compared byte by byte with its original (the .bak file), using one worker
+process per CPU core, unless --jobs is specified. Scripts, which store the
+data in another layout (like the end marker of SGX files), can pass a
+function, which converts the original to the expected unpacked data.
+"""
+
+
+CACHE_VERSION = "zx0 v2.2"      # change, if the compressed output changes
+ZX0_TOOLS = ["-zx0", "zx0"]     # names of the ZX0 command line tool
+ENTROPY_MIN = 7.0               # bits per byte, below ZX0 is always tried
+
+options = None      # command line options, also passed to worker processes
+stats = {"cache_hit": 0, "cache_miss": 0, "verify_ok": 0, "verify_fail": 0, "precheck_skip": 0}
+
+area_jobs = 1       # worker processes for the areas of one file
+area_pool = None
+
+zx0_loop = None     # event loop, which starts the ZX0 tool processes (--zx0-exe)
+zx0_slots = None    # semaphore, which limits the running ZX0 tool processes
+area_threads = None # threads for the areas, when zx0_loop is running
+out_thread = threading.local()  # console output of the current job thread
+stats_lock = threading.Lock()
+
+metrics_thread = threading.local()  # metrics of the current job (--stats-json)
+metrics_files = []                  # metrics of all files
+
+
+### ---------------------------------------------------------------------------
+### load binary
+### ---------------------------------------------------------------------------
+def bin_load(file):
+    fil_bin = open(file, "rb")
+    binary = fil_bin.read()
+    fil_bin.close()
+    return binary
+
+
+### ---------------------------------------------------------------------------
+### save binary
+### ---------------------------------------------------------------------------
+def bin_save(file, binary):
+    fil_bin = open(file, "wb")
+    fil_bin.write(binary)
+    fil_bin.close()
+
+
+### ---------------------------------------------------------------------------
+### create command line parser
+### ---------------------------------------------------------------------------
+def arg_parser(script, filetypes):
+    parser = argparse.ArgumentParser(prog=f"python3 {script}")
+    parser.add_argument("filemask", nargs="+", help=f"file(s) to compress ({filetypes})")
+    parser.add_argument("--jobs", type=int, metavar="N", help="compress N files in parallel (0 = one per CPU core)")
+    parser.add_argument("--zx0-exe", metavar="PATH", help="use the ZX0 command line tool at PATH (default: -zx0 or zx0, if found)")
+    parser.add_argument("--in-process", action="store_true", help="use the in-process compressor, even if the ZX0 tool is found")
+    parser.add_argument("--draft", action="store_true", help="compress fast, but not optimal (for development builds)")
+    parser.add_argument("--cache", metavar="DIR", help="keep compressed areas in DIR and reuse them for unchanged data")
+    parser.add_argument("--cache-size", type=int, default=64, metavar="MB", help="maximum size of the cache (default 64)")
+    parser.add_argument("--precheck", type=float, default=1, metavar="PCT", help="don't compress areas with less than PCT%% repeated 3-byte sequences (default 1, 0 = off)")
+    parser.add_argument("--unpack-time", action="store_true", help="report estimated load and unpack time of each area")
+    parser.add_argument("--load-budget", type=float, metavar="PCT", help="keep areas uncompressed, if they load slower than PCT%% of the uncompressed time")
+    parser.add_argument("--disk-speed", type=float, default=20, metavar="KB/s", help="disk throughput for load times (default 20)")
+    parser.add_argument("--cpu-mhz", type=float, default=4, metavar="MHZ", help="Z80 clock for unpack times (default 4)")
+    parser.add_argument("--stats-json", metavar="FILE", help="save times and sizes of every stage, file and area as JSON in FILE")
+    parser.add_argument("--verify", action="store_true", help="unpack compressed files and compare them with the .bak originals")
+    return parser
+
+
+### ---------------------------------------------------------------------------
+### set options (in the main and in every worker process)
+### ---------------------------------------------------------------------------
+def options_set(args):
+    global options
+    options = args
+    if options.zx0_exe is None and not options.in_process:
+        options.zx0_exe = zx0_find()
+    if options.cache is not None:
+        os.makedirs(options.cache, exist_ok=True)
+
+
+### ---------------------------------------------------------------------------
+### find the ZX0 command line tool in the script directory or in PATH
+### ---------------------------------------------------------------------------
+def zx0_find():
+    path = os.path.dirname(os.path.abspath(__file__)) + os.pathsep + os.environ.get("PATH", "")
+    for name in ZX0_TOOLS:
+        zx0_exe = shutil.which(name, path=path)
+        if zx0_exe is not None:
+            return zx0_exe
+    return None
+
+
+### ---------------------------------------------------------------------------
+### get files from filemasks
+### ---------------------------------------------------------------------------
+def file_list(filemasks):
+    files = []
+    for filemask in filemasks:
+        for file in glob.glob(filemask):
+            if file not in files:
+                files.append(file)
+    return files
+
+
+### ---------------------------------------------------------------------------
+### check, if data is worth to be compressed
+### ---------------------------------------------------------------------------
+# Counter and zip do the counting in C, so this takes a few ms even for 64K.
+def compressible(binary):
+    len_bin = len(binary)
+    if options is None or options.precheck <= 0 or len_bin < 256:
+        return True
+
+    with stage("precheck"):
+        entropy = -sum(count * math.log2(count / len_bin) for count in collections.Counter(binary).values()) / len_bin
+        if entropy < ENTROPY_MIN:
+            return True
+
+        repeats = len_bin - 2 - len(set(zip(binary, binary[1:], binary[2:])))
+        if repeats * 100 >= options.precheck * (len_bin - 2):
+            return True
+
+    stats_count("precheck_skip")
+    return False
+
+
+### ---------------------------------------------------------------------------
+### command line for the ZX0 tool (without the file names)
+### ---------------------------------------------------------------------------
+def zx0_cmd(skip, quick):
+    cmd = [options.zx0_exe]
+    if quick:
+        cmd.append("-q")
+    if skip > 0:
+        cmd.append(f"+{skip}")
+    return cmd
+
+
+### ---------------------------------------------------------------------------
+### compress data with ZX0, in-process or with the command line tool
+### ---------------------------------------------------------------------------
+def zx0_run(binary, skip=0, quick=False, greedy=False):
+    if options is None or options.zx0_exe is None:
+        return zx0.compress(binary, skip, quick, greedy)
+    if zx0_loop is not None:
+        return asyncio.run_coroutine_threadsafe(zx0_exec(binary, skip, quick), zx0_loop).result()
+
+    with tempfile.TemporaryDirectory(prefix="zx0_") as dir_temp:
+        fil_temp = os.path.join(dir_temp, "temp")
+        bin_save(fil_temp, binary)
+        subprocess.run(zx0_cmd(skip, quick) + [fil_temp, fil_temp + ".zx0"], stdout=subprocess.DEVNULL, check=True)
+        return bin_load(fil_temp + ".zx0")
+
+
+### ---------------------------------------------------------------------------
+### compress data with the ZX0 command line tool, started by zx0_loop
+### ---------------------------------------------------------------------------
+async def zx0_exec(binary, skip=0, quick=False):
+    cmd = zx0_cmd(skip, quick)
+
+    with tempfile.TemporaryDirectory(prefix="zx0_") as dir_temp:
+        fil_temp = os.path.join(dir_temp, "temp")
+        bin_save(fil_temp, binary)
+        async with zx0_slots:
+            process = await asyncio.create_subprocess_exec(*cmd, fil_temp, fil_temp + ".zx0", stdout=asyncio.subprocess.DEVNULL)
+            if await process.wait() != 0:
+                raise subprocess.CalledProcessError(process.returncode, cmd)
+        return bin_load(fil_temp + ".zx0")
+
+
+### ---------------------------------------------------------------------------
+### get ZX0 mode (quick, greedy), --draft uses the fastest one available
+### ---------------------------------------------------------------------------
+def zx0_mode(quick=False):
+    greedy = False
+    if options is not None and options.draft:
+        if options.zx0_exe is None:
+            greedy = True
+        else:
+            quick = True
+    return quick, greedy
+
+
+### ---------------------------------------------------------------------------
+### compress data with ZX0, using the cache if activated
+### ---------------------------------------------------------------------------
+# quick = use the quick mode of ZX0 (faster, but only offsets up to 2176)
+def zx0_compress(binary, skip=0, quick=False):
+    quick, greedy = zx0_mode(quick)
+    if options is None or options.cache is None:
+        with stage("zx0"):
+            return zx0_run(binary, skip, quick, greedy)
+
+    key = hashlib.sha256(f"{CACHE_VERSION} +{skip}{' -q' if quick else ''}{' greedy' if greedy else ''}\n".encode())
+    key.update(binary)
+    fil_cache = os.path.join(options.cache, key.hexdigest() + ".zx0")
+
+    try:
+        bin_crn = bin_load(fil_cache)
+        os.utime(fil_cache)
+        stats_count("cache_hit")
+        return bin_crn
+    except OSError:
+        pass
+
+    stats_count("cache_miss")
+    with stage("zx0"):
+        bin_crn = zx0_run(binary, skip, quick, greedy)
+    fil_temp = f"{fil_cache}.{os.getpid()}.{threading.get_ident()}"
+    bin_save(fil_temp, bin_crn)
+    os.replace(fil_temp, fil_cache)
+    return bin_crn
+
+
+### ---------------------------------------------------------------------------
+### decompress area (last 4 bytes, uncompressed length, uncompressed data, zx0)
+### ---------------------------------------------------------------------------
+def area_unpack(bin_crn):
+    if len(bin_crn) < 6:
+        raise ValueError("area too short")
+    uncompressed = bin_crn[4] + 256 * bin_crn[5]
+    bin_prefix = bin_crn[6:6 + uncompressed]
+    return bin_prefix + zx0.decompress(bin_crn[6 + uncompressed:], bin_prefix) + bin_crn[:4]
+
+
+### ---------------------------------------------------------------------------
+### estimate time for decompressing an area in ms
+### ---------------------------------------------------------------------------
+# len_copy = bytes copied by the loader besides the ZX0 data (the last 4 bytes
+# and the uncompressed prefix), always = also calculate it without a time option
+def unpack_time(bin_zx0, len_copy=4, always=False):
+    if not always and (options is None or (not options.unpack_time and options.load_budget is None)):
+        return 0
+    with stage("unpack_time"):
+        return (zx0.unpack_tstates(bin_zx0) + 21 * len_copy) / (options.cpu_mhz * 1000)
+
+
+### ---------------------------------------------------------------------------
+### estimate time for reading data from disk in ms
+### ---------------------------------------------------------------------------
+def load_time(length):
+    return length / options.disk_speed * 1000 / 1024
+
+
+### ---------------------------------------------------------------------------
+### report load time of a compressed area and check it against the budget
+### ---------------------------------------------------------------------------
+# returns False, if the area should better be stored uncompressed
+def unpack_check(len_org, len_out, tim_unpack, name=None):
+    if options is None or (not options.unpack_time and options.load_budget is None):
+        return True
+
+    tim_org = load_time(len_org)
+    tim_out = load_time(len_out) + tim_unpack
+    keep = options.load_budget is None or tim_out <= tim_org * options.load_budget / 100
+
+    if options.unpack_time:
+        txt_report = f"unpack {tim_unpack:.1f}ms, load {tim_out:.1f}ms (uncompressed {tim_org:.1f}ms)"
+        if not keep:
+            txt_report += " -> over budget, stored uncompressed"
+        if name is not None:
+            txt_report = f"{name}: {txt_report}"
+        print("  " + txt_report)
+    return keep
+
+
+### ---------------------------------------------------------------------------
+### remove least recently used cache entries
+### ---------------------------------------------------------------------------
+def cache_trim():
+    entries = []
+    for entry in os.scandir(options.cache):
+        if entry.name.endswith(".zx0"):
+            entry_stat = entry.stat()
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+    entries.sort()
+
+    len_cache = sum(entry[1] for entry in entries)
+    for entry in entries:
+        if len_cache <= options.cache_size * 1024 * 1024:
+            break
+        try:
+            os.remove(entry[2])
+        except OSError:
+            pass
+        len_cache -= entry[1]
+
+
+### ---------------------------------------------------------------------------
+### run function in a worker process, return its result, output and statistics
+### ---------------------------------------------------------------------------
+def job_run(args, function, *params):
+    options_set(args)
+    stats_old = dict(stats)
+    txt_out = io.StringIO()
+    with contextlib.redirect_stdout(txt_out):
+        result, metrics = job_metrics(function, *params)
+    return result, txt_out.getvalue(), {key: stats[key] - stats_old[key] for key in stats}, metrics
+
+
+### ---------------------------------------------------------------------------
+### run function in a job thread and collect its console output
+### ---------------------------------------------------------------------------
+def job_thread(function, *params):
+    out_thread.txt = io.StringIO()
+    try:
+        result, metrics = job_metrics(function, *params)
+        return result, out_thread.txt.getvalue(), metrics
+    finally:
+        del out_thread.txt
+
+
+### ---------------------------------------------------------------------------
+### count event (job threads may do this at the same time)
+### ---------------------------------------------------------------------------
+def stats_count(key):
+    with stats_lock:
+        stats[key] += 1
+    metrics = getattr(metrics_thread, "metrics", None)
+    if metrics is not None:
+        metrics["counts"][key] = metrics["counts"].get(key, 0) + 1
+
+
+### ---------------------------------------------------------------------------
+### run function and collect its metrics, return its result and metrics
+### ---------------------------------------------------------------------------
+def job_metrics(function, *params):
+    metrics_old = getattr(metrics_thread, "metrics", None)
+    metrics_thread.metrics = {"seconds": 0, "bytes_in": 0, "bytes_out": 0, "stages": {}, "areas": [], "counts": {}}
+    tim_start = time.perf_counter()
+    try:
+        result = function(*params)
+        metrics = metrics_thread.metrics
+        metrics["seconds"] = time.perf_counter() - tim_start
+        return result, metrics
+    finally:
+        metrics_thread.metrics = metrics_old
+
+
+### ---------------------------------------------------------------------------
+### measure time of a stage of the current job
+### ---------------------------------------------------------------------------
+@contextlib.contextmanager
+def stage(name):
+    tim_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = getattr(metrics_thread, "metrics", None)
+        if metrics is not None:
+            metrics["stages"][name] = metrics["stages"].get(name, 0) + time.perf_counter() - tim_start
+
+
+### ---------------------------------------------------------------------------
+### add size of an area of the current job
+### ---------------------------------------------------------------------------
+def metrics_area(name, len_in, len_out):
+    metrics = getattr(metrics_thread, "metrics", None)
+    if metrics is not None:
+        metrics["areas"].append({"name": name, "bytes_in": len_in, "bytes_out": len_out})
+
+
+### ---------------------------------------------------------------------------
+### set file size of the current job
+### ---------------------------------------------------------------------------
+def metrics_file(len_in, len_out):
+    metrics = getattr(metrics_thread, "metrics", None)
+    if metrics is not None:
+        metrics["bytes_in"] = len_in
+        metrics["bytes_out"] = len_out
+
+
+### ---------------------------------------------------------------------------
+### add metrics of an area job to the current job
+### ---------------------------------------------------------------------------
+def metrics_add(metrics_job):
+    metrics = getattr(metrics_thread, "metrics", None)
+    if metrics is None:
+        return
+    for key in metrics_job["stages"]:
+        metrics["stages"][key] = metrics["stages"].get(key, 0) + metrics_job["stages"][key]
+    for key in metrics_job["counts"]:
+        metrics["counts"][key] = metrics["counts"].get(key, 0) + metrics_job["counts"][key]
+    metrics["areas"] += metrics_job["areas"]
+
+
+### ---------------------------------------------------------------------------
+### save metrics of all files and of the whole batch as JSON
+### ---------------------------------------------------------------------------
+def metrics_save(file, seconds):
+    total = {"files": len(metrics_files), "seconds": seconds, "bytes_in": 0, "bytes_out": 0, "areas": 0, "stages": {}, "counts": {}}
+    for metrics in metrics_files:
+        total["bytes_in"] += metrics["bytes_in"]
+        total["bytes_out"] += metrics["bytes_out"]
+        total["areas"] += len(metrics["areas"])
+        for key in metrics["stages"]:
+            total["stages"][key] = total["stages"].get(key, 0) + metrics["stages"][key]
+        for key in metrics["counts"]:
+            total["counts"][key] = total["counts"].get(key, 0) + metrics["counts"][key]
+    total["kb_per_second"] = total["bytes_in"] / 1024 / seconds if seconds > 0 else 0
+
+    with open(file, "w") as fil_json:
+        json.dump({"files": metrics_files, "batch": total}, fil_json, indent=2)
+
+
+### ---------------------------------------------------------------------------
+### add statistics of a worker process
+### ---------------------------------------------------------------------------
+def stats_add(stats_job):
+    for key in stats_job:
+        stats[key] += stats_job[key]
+
+
+### ---------------------------------------------------------------------------
+### compress all files
+### ---------------------------------------------------------------------------
+def batch(function, files, jobs=1):
+    global area_jobs
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if jobs <= 1 or len(files) == 1:
+        area_jobs = jobs
+        for file in files:
+            result, metrics = job_metrics(function, file)
+            metrics_files.append({"file": file, **metrics})
+        return
+
+    jobs = min(jobs, len(files))
+
+    with ProcessPoolExecutor(jobs) as pool:
+        jobs_all = [pool.submit(job_run, options, function, file) for file in files]
+        for file, job in zip(files, jobs_all):
+            result, txt_out, stats_job, metrics = job.result()
+            print(txt_out, end="")
+            stats_add(stats_job)
+            metrics_files.append({"file": file, **metrics})
+
+
+### ---------------------------------------------------------------------------
+### compress all files with the ZX0 command line tool, in one event loop
+### ---------------------------------------------------------------------------
+# The files and areas run in threads, which only wait for the tool processes.
+# sys.stdout is replaced by a dispatcher, which writes into the output buffer
+# of the current job thread (or to the console, if there is none).
+async def batch_async(function, files):
+    global zx0_loop, zx0_slots, area_threads
+    slots = options.jobs or os.cpu_count() or 1
+    zx0_loop = asyncio.get_running_loop()
+    zx0_slots = asyncio.Semaphore(slots)
+    stdout_org = sys.stdout
+    sys.stdout = types.SimpleNamespace(write=lambda txt: getattr(out_thread, "txt", stdout_org).write(txt), flush=lambda: None)
+
+    try:
+        with ThreadPoolExecutor(slots) as file_threads, ThreadPoolExecutor(slots) as area_threads:
+            jobs_all = [zx0_loop.run_in_executor(file_threads, job_thread, function, file) for file in files]
+            try:
+                for file, job in zip(files, jobs_all):
+                    result, txt_out, metrics = await job
+                    print(txt_out, end="")
+                    metrics_files.append({"file": file, **metrics})
+            finally:
+                # the other threads may still need the loop
+                await asyncio.wait(jobs_all)
+    finally:
+        sys.stdout = stdout_org
+        zx0_loop = None
+        area_threads = None
+
+
+### ---------------------------------------------------------------------------
+### run function for multiple areas in job threads of zx0_loop
+### ---------------------------------------------------------------------------
+async def areas_async(function, areas):
+    jobs_all = [zx0_loop.run_in_executor(area_threads, job_thread, function, *area) for area in areas]
+    return await asyncio.gather(*jobs_all, return_exceptions=True)
+
+
+### ---------------------------------------------------------------------------
+### run function for multiple areas, in parallel if possible
+### ---------------------------------------------------------------------------
+# areas can also be a generator, its areas are compressed as soon as they come
+def area_map(function, areas):
+    global area_pool
+    if zx0_loop is not None:
+        results = []
+        jobs_all = asyncio.run_coroutine_threadsafe(areas_async(function, areas), zx0_loop).result()
+        for job in jobs_all:
+            if isinstance(job, BaseException):
+                raise job
+        for result, txt_out, metrics in jobs_all:
+            print(txt_out, end="")
+            results.append(result)
+            metrics_add(metrics)
+        return results
+
+    if area_jobs <= 1 or (isinstance(areas, list) and len(areas) < 2):
+        return [function(*area) for area in areas]
+
+    if area_pool is None:
+        area_pool = ProcessPoolExecutor(area_jobs)
+    jobs_all = [area_pool.submit(job_run, options, function, *area) for area in areas]
+    results = []
+    for job in jobs_all:
+        result, txt_out, stats_job, metrics = job.result()
+        print(txt_out, end="")
+        results.append(result)
+        stats_add(stats_job)
+        metrics_add(metrics)
+    return results
+
+
+### ---------------------------------------------------------------------------
+### unpack one compressed file and compare it with its original
+### ---------------------------------------------------------------------------
+# expect(bin_org) returns the data, which unpacking has to give (or None)
+def verify(unpack, expect, file):
+
+    print("Verifying " + file.upper() + "...")
+
+    try:
+        bin_org = bin_load(file + ".bak")
+    except OSError:
+        print("No original (.bak) found")
+        print("")
+        return
+
+    try:
+        if expect is not None:
+            bin_org = expect(bin_org)
+        bin_unp = unpack(bin_load(file))
+    except (IndexError, ValueError) as error:
+        bin_unp = None
+        print(f"## UNPACK ERROR ({error})")
+
+    if bin_unp == bin_org:
+        stats["verify_ok"] += 1
+        print("OK")
+    else:
+        stats["verify_fail"] += 1
+        if bin_unp is not None:
+            adr = 0
+            while adr < min(len(bin_unp), len(bin_org)) and bin_unp[adr] == bin_org[adr]:
+                adr += 1
+            print(f"## MISMATCH AT {adr} (unpacked {len(bin_unp)}, original {len(bin_org)})")
+    print("")
+
+
+### ---------------------------------------------------------------------------
+### run compress script
+### ---------------------------------------------------------------------------
+# arg_add(parser) can add options of the script, expect(bin_org) converts the
+# original for --verify
+def main(function, script, filetypes, unpack, arg_add=None, expect=None):
+    parser = arg_parser(script, filetypes)
+    if arg_add is not None:
+        arg_add(parser)
+    options_set(parser.parse_args())
+    files = file_list(options.filemask)
+    if len(files) == 0:
+        print("File(s) not found")
+        return
+
+    if options.verify:
+        batch(functools.partial(verify, unpack, expect), files, 0 if options.jobs is None else options.jobs)
+        print(f"verify: {stats['verify_ok']} ok, {stats['verify_fail']} failed")
+        return
+
+    tim_start = time.perf_counter()
+    if options.zx0_exe is not None:
+        asyncio.run(batch_async(function, files))
+    else:
+        batch(function, files, 1 if options.jobs is None else options.jobs)
+    if options.stats_json is not None:
+        metrics_save(options.stats_json, time.perf_counter() - tim_start)
+
+    if options.cache is not None:
+        cache_trim()
+        print(f"cache: {stats['cache_hit']} hits, {stats['cache_miss']} misses")
+    if stats["precheck_skip"] > 0:
+        print(f"precheck: {stats['precheck_skip']} incompressible areas, ZX0 not called")
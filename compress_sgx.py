@@ -1,7 +1,6 @@
-import subprocess
-import sys
 import math
-import glob
+import os
+import compress_lib
 
 
 ### ===========================================================================
@@ -12,18 +11,38 @@ import glob
 Compresses multiple SGX graphic file, using the ZX0 compressor by Einar Saukas.
 
 usage:
-python3 compress_sgx.py [filemask].sgx
+python3 compress_sgx.py [filemask].sgx [options]
+
+options:
+--jobs N            compress N files in parallel (0 = one per CPU core)
+--zx0-exe PATH      use the ZX0 command line tool at PATH (default: -zx0 or zx0
+                    in the script directory or in PATH, if found)
+--in-process        use the in-process compressor, even if the tool is found
+--draft             compress fast, but not optimal (for development builds)
+--cache DIR         reuse compressed areas of unchanged data from DIR
+--cache-size MB     maximum size of the cache (default 64)
+--unpack-time       report estimated load and unpack time of each area
+--load-budget PCT   keep areas uncompressed, which load slower than PCT% of
+                    the uncompressed time
+--disk-speed KB/s   disk throughput for load times (default 20)
+--cpu-mhz MHZ       Z80 clock for unpack times (default 4)
+--stats-json FILE   save times and sizes of every stage, file and area as JSON
+--verify            unpack compressed files and compare them with the .bak
+                    originals instead of compressing
+--split-search      try row-aligned block splits for extended graphic parts
+                    and keep the smallest
+
+Extended graphic parts larger than one block are split into blocks of max
+16K. By default this is the classic split into full blocks. --split-search
+also tries three splits, which cut only between lines: full blocks first,
+the same number of lines in every block and full blocks last. These are
+fixed candidates, not a search over all cut points. The blocks of all
+candidates are compressed (in parallel with --jobs), so this costs up to 4
+times the compression work of a part, but the result doesn't depend on
+--jobs or the number of CPU cores.
 """
 
 
-### ---------------------------------------------------------------------------
-### execute shell command
-### ---------------------------------------------------------------------------
-def run_cmd(cmd):
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-    c = p.communicate()
-
-
 ### ---------------------------------------------------------------------------
 ### load binary
 ### ---------------------------------------------------------------------------
@@ -43,6 +62,13 @@ def bin_save(file, binary):
     fil_bin.close()
 
 
+### ---------------------------------------------------------------------------
+### get word from binary
+### ---------------------------------------------------------------------------
+def word_get(binary):
+    return binary[0] + 256 * binary[1]
+
+
 ### ---------------------------------------------------------------------------
 ### return word as binary
 ### ---------------------------------------------------------------------------
@@ -54,12 +80,37 @@ def word_bin(word):
 ### compress data
 ### ---------------------------------------------------------------------------
 def compress(binary):
-    bin_save("temp", binary[:len(binary) - 4])
-    run_cmd("-zx0 temp")
-    bin_crn = bin_load("temp.zx0")
-    run_cmd("del temp")
-    run_cmd("del temp.zx0")
-    return binary[len(binary) - 4:] + bytearray(2) + bin_crn
+    bin_zx0 = compress_lib.zx0_compress(binary[:len(binary) - 4])
+    return bytes(binary[len(binary) - 4:]) + bytearray(2) + bin_zx0, compress_lib.unpack_time(bin_zx0)
+
+
+### ---------------------------------------------------------------------------
+### build index of all graphic parts and linefeeds of an uncompressed SGX
+### ---------------------------------------------------------------------------
+# Returns a list of (type, adr, len_part), which can be used to get every part
+# as a memoryview slice of the file without copying it. The index ends at the
+# end marker, at an unknown type or at a truncated part.
+def sgx_index(bin_sgx):
+
+    parts = []
+
+    adr = 0
+    while adr < len(bin_sgx) and bin_sgx[adr] != 0:
+        typ = int(bin_sgx[adr])
+        if typ < 64 and adr + 3 <= len(bin_sgx):
+            len_part = 3 + typ * bin_sgx[adr + 2]
+        elif typ == 64 and adr + 8 <= len(bin_sgx):
+            len_part = 8 + word_get(bin_sgx[adr + 2:adr + 4]) * word_get(bin_sgx[adr + 6:adr + 8])
+        elif typ == 255:
+            len_part = 3
+        else:
+            break
+        if adr + len_part > len(bin_sgx):
+            break
+        parts.append((typ, adr, len_part))
+        adr += len_part
+
+    return parts
 
 
 ### ---------------------------------------------------------------------------
@@ -68,12 +119,37 @@ def compress(binary):
 def compress_smp(binary, i):
 
     print(f"part {i} simple..")
-    bin_len = binary[0] * binary[2]
-    if len(binary) + 3 < bin_len:
-        return bytearray(), bytearray(1)
-    bin_crn = compress(binary[3:3 + bin_len])
+    bin_crn, tim_unpack = compress(binary[3:])
+    if not compress_lib.unpack_check(len(binary), 5 + len(bin_crn), tim_unpack):
+        return binary
 
-    return bytearray([128 + binary[0]]) + binary[1:3] + word_bin(len(bin_crn)) + bin_crn, binary[3 + bin_len:]
+    return bytearray([128 + binary[0]]) + binary[1:3] + word_bin(len(bin_crn)) + bin_crn
+
+
+### ---------------------------------------------------------------------------
+### get candidates for splitting extended graphic data into blocks
+### ---------------------------------------------------------------------------
+# Every candidate is a list of block lengths. The first one is the classic
+# split into blocks of max_len bytes, the others only cut between two lines:
+# full blocks first, the same number of lines in every block, full blocks last.
+def split_candidates(len_data, len_line, max_len):
+    splits = [[min(max_len, len_data - adr) for adr in range(0, len_data, max_len)]]
+    if len(splits[0]) < 2 or len_line == 0 or len_line > max_len:
+        return splits
+
+    lines = int(len_data / len_line)
+    max_lines = int(max_len / len_line)
+    blocks = int(math.ceil(lines / max_lines))
+    lines_greedy = [max_lines] * int(lines / max_lines)
+    if lines % max_lines > 0:
+        lines_greedy.append(lines % max_lines)
+    lines_equal = [int(lines / blocks) + (1 if block < lines % blocks else 0) for block in range(blocks)]
+
+    for lines_split in (lines_greedy, lines_equal, lines_greedy[::-1]):
+        split = [len_line * lines_block for lines_block in lines_split]
+        if split not in splits:
+            splits.append(split)
+    return splits
 
 
 ### ---------------------------------------------------------------------------
@@ -82,9 +158,6 @@ def compress_smp(binary, i):
 def compress_ext(binary, i):
 
     print(f"part {i} extended..")
-    bin_len = (binary[2] + binary[3] * 256) * (binary[6] + binary[7] * 256)
-    if len(binary) + 8 < bin_len:
-        return bytearray(), bytearray(1)
 
     if binary[1] == 0:
         max_len = 63        # xlen in bytes maximum for 4...
@@ -93,14 +166,46 @@ def compress_ext(binary, i):
     max_len = 16384 - 256 - 10 * int(math.ceil(binary[2] / max_len))
                             # maxlen per block = 16384-256-10*number of heads
 
-    bin_data = binary[8:8 + bin_len]
+    # compress the blocks of all candidates (in parallel, if possible)
+    len_line = word_get(binary[2:4])
+    splits = split_candidates(len(binary) - 8, len_line, max_len)
+    if not compress_lib.options.split_search:
+        splits = splits[:1]
+    blocks = []
+    for split in splits:
+        adr = 8
+        for len_block in split:
+            if (adr, len_block) not in blocks:
+                blocks.append((adr, len_block))
+            adr += len_block
+    blocks_crn = dict(zip(blocks, compress_lib.area_map(compress, [(bytes(binary[adr:adr + len_block]),) for adr, len_block in blocks])))
+
+    # take the smallest candidate, the classic one if there is no difference
+    split_best = None
+    for split in splits:
+        len_split = 0
+        adr = 8
+        for len_block in split:
+            len_split += 2 + len(blocks_crn[(adr, len_block)][0])
+            adr += len_block
+        if split_best is None or len_split < len_best:
+            split_best = split
+            len_best = len_split
+    if split_best is not splits[0]:
+        print(f"  blocks of {'/'.join(str(int(len_block / len_line)) for len_block in split_best)} lines")
+
     bin_out = bytearray([128 + 64]) + binary[1:8]
-    while len(bin_data) > 0:
-        bin_crn = compress(bin_data[:max_len])
+    tim_unpack = 0
+    adr = 8
+    for len_block in split_best:
+        bin_crn, tim_block = blocks_crn[(adr, len_block)]
         bin_out += word_bin(len(bin_crn)) + bin_crn
-        bin_data = bin_data[max_len:]
+        tim_unpack += tim_block
+        adr += len_block
+    if not compress_lib.unpack_check(len(binary), len(bin_out), tim_unpack):
+        return binary
 
-    return bin_out, binary[8 + bin_len:]
+    return bin_out
 
 
 ### ---------------------------------------------------------------------------
@@ -112,45 +217,114 @@ def compress_sgx(file):
     
     bin_out = bytearray()
 
-    # load exe
-    bin_sgx = bin_load(file) + bytearray(1)
-    if int(bin_sgx[0]) > 128:
+    # load sgx
+    with compress_lib.stage("load"):
+        bin_sgx = memoryview(bin_load(file))
+    if len(bin_sgx) > 0 and int(bin_sgx[0]) > 128:
         print("File already compressed")
         print("")
         return
-    len_org = len(bin_sgx)
+    len_org = len(bin_sgx) + 1      # with end marker
 
     # chunks
+    with compress_lib.stage("parse"):
+        parts = sgx_index(bin_sgx)
     i = 1
-    while bin_sgx[:1] != bytearray(1):
-        if (bin_sgx[0] > 0) and (bin_sgx[0] < 64):
-            bin_crn, bin_sgx = compress_smp(bin_sgx, i)
-            i += 1
-        elif bin_sgx[0] == 64:
-            bin_crn, bin_sgx = compress_ext(bin_sgx, i)
+    for typ, adr, len_part in parts:
+        bin_part = bin_sgx[adr:adr + len_part]
+        if typ == 64:
+            bin_crn = compress_ext(bin_part, i)
+            compress_lib.metrics_area(f"part {i}", len_part, len(bin_crn))
             i += 1
-        elif bin_sgx[0] == 255:
+        elif typ == 255:
             bin_crn = bytearray([255,0,0])
-            bin_sgx = bin_sgx[3:]
             print("linefeed..")
         else:
-            break
+            bin_crn = compress_smp(bin_part, i)
+            compress_lib.metrics_area(f"part {i}", len_part, len(bin_crn))
+            i += 1
         bin_out += bin_crn
     bin_out += bytearray(3)
 
     # save compressed sgx
-    run_cmd(f"ren {file} {file}.bak")
-    bin_save(file, bin_out)
+    with compress_lib.stage("save"):
+        os.replace(file, file + ".bak")
+        bin_save(file, bin_out)
 
     len_crn = len(bin_out)
+    compress_lib.metrics_file(len_org, len_crn)
     print(f"DONE! compressed from {len_org} to {len_crn} ({len_crn/len_org*100:.0f}%)")
     print("")
 
 
+### ---------------------------------------------------------------------------
+### unpack one compressed SGX file
+### ---------------------------------------------------------------------------
+def decompress_sgx(bin_sgx):
+
+    bin_out = bytearray()
+
+    adr = 0
+    while adr < len(bin_sgx) and bin_sgx[adr] != 0:
+        typ = int(bin_sgx[adr])
+        if typ == 255:
+            # linefeed
+            bin_out += bin_sgx[adr:adr + 3]
+            adr += 3
+        elif typ & 127 < 64:
+            # simple graphic part
+            bin_len = (typ & 127) * bin_sgx[adr + 2]
+            if typ >= 128:
+                len_crn = word_get(bin_sgx[adr + 3:adr + 5])
+                bin_out += bytearray([typ - 128]) + bin_sgx[adr + 1:adr + 3] + compress_lib.area_unpack(bin_sgx[adr + 5:adr + 5 + len_crn])
+                adr += 5 + len_crn
+            else:
+                bin_out += bin_sgx[adr:adr + 3 + bin_len]
+                adr += 3 + bin_len
+        elif typ & 127 == 64:
+            # extended graphic part
+            bin_len = word_get(bin_sgx[adr + 2:adr + 4]) * word_get(bin_sgx[adr + 6:adr + 8])
+            if typ >= 128:
+                bin_out += bytearray([64]) + bin_sgx[adr + 1:adr + 8]
+                adr += 8
+                while bin_len > 0:
+                    len_crn = word_get(bin_sgx[adr:adr + 2])
+                    bin_data = compress_lib.area_unpack(bin_sgx[adr + 2:adr + 2 + len_crn])
+                    bin_out += bin_data
+                    bin_len -= len(bin_data)
+                    adr += 2 + len_crn
+            else:
+                bin_out += bin_sgx[adr:adr + 8 + bin_len]
+                adr += 8 + bin_len
+        else:
+            raise ValueError(f"unknown part type {typ}")
+
+    return bin_out + bin_sgx[adr:]
+
+
+### ---------------------------------------------------------------------------
+### add SGX options to command line parser
+### ---------------------------------------------------------------------------
+def arg_add(parser):
+    parser.add_argument("--split-search", action="store_true", help="try row-aligned block splits for extended graphic parts and keep the smallest")
+
+
+### ---------------------------------------------------------------------------
+### get the data of an uncompressed SGX, which unpacking has to give
+### ---------------------------------------------------------------------------
+# Only the indexed parts are compressed, linefeeds are stored as 255,0,0 and
+# the end marker is always added, even if the original has none.
+def sgx_expect(bin_sgx):
+    bin_out = bytearray()
+    for typ, adr, len_part in sgx_index(bin_sgx):
+        if typ == 255:
+            bin_out += bytearray([255,0,0])
+        else:
+            bin_out += bin_sgx[adr:adr + len_part]
+    return bin_out + bytearray(3)
+
+
 ### batch
-files = glob.glob(sys.argv[1])
-if len(files) == 0:
-    print("File(s) not found")
-else:
-    for file in files:
-        compress_sgx(file)
+if __name__ == "__main__":
+    compress_lib.main(compress_sgx, "compress_sgx.py", "SGX", decompress_sgx, arg_add, sgx_expect)
+
@@ -1,6 +1,8 @@
-import subprocess
-import sys
-import glob
+import hashlib
+import mmap
+import os
+import time
+import compress_lib
 
 
 ### ===========================================================================
@@ -14,17 +16,33 @@ hardware.
 Attention: Compressed SNA files can't be loaded with other emulator or tools
 anymore!
 
-usage:
-python3 compress_sna.py [filemask].sna
-"""
+Version 1 and 2 snapshots contain a flat memory dump. Version 3 snapshots can
+store each 64K bank in a MEM0...MEM8 chunk (RLE compressed or not), which is
+used for expanded RAM up to 576K. The snapshot file is memory mapped, and the
+banks are unpacked and compressed one after another. The compressed file
+contains the whole memory as a flat dump (first 128K in 4K/60K/60K/4K banks,
+expanded RAM in 16K banks), other chunks are removed, and version 3 headers
+of snapshots up to 128K are changed to version 2. --verify compares with the
+original converted in the same way.
 
+usage:
+python3 compress_sna.py [filemask].sna [options]
 
-### ---------------------------------------------------------------------------
-### execute shell command
-### ---------------------------------------------------------------------------
-def run_cmd(cmd):
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-    c = p.communicate()
+options:
+--jobs N            compress N files in parallel (0 = one per CPU core)
+--zx0-exe PATH      use the ZX0 command line tool at PATH (default: -zx0 or zx0
+                    in the script directory or in PATH, if found)
+--in-process        use the in-process compressor, even if the tool is found
+--draft             compress fast, but not optimal (for development builds)
+--cache DIR         reuse compressed areas of unchanged data from DIR
+--cache-size MB     maximum size of the cache (default 64)
+--unpack-time       report estimated load and unpack time of each bank
+--disk-speed KB/s   disk throughput for load times (default 20)
+--cpu-mhz MHZ       Z80 clock for unpack times (default 4)
+--stats-json FILE   save times and sizes of every stage, file and area as JSON
+--verify            unpack compressed files and compare them with the .bak
+                    originals instead of compressing
+"""
 
 
 ### ---------------------------------------------------------------------------
@@ -46,6 +64,13 @@ def bin_save(file, binary):
     fil_bin.close()
 
 
+### ---------------------------------------------------------------------------
+### get word from binary
+### ---------------------------------------------------------------------------
+def word_get(binary):
+    return binary[0] + 256 * binary[1]
+
+
 ### ---------------------------------------------------------------------------
 ### return word as binary
 ### ---------------------------------------------------------------------------
@@ -56,14 +81,117 @@ def word_bin(word):
 ### ---------------------------------------------------------------------------
 ### compress data
 ### ---------------------------------------------------------------------------
+# returns compressed data, estimated unpack time and compression time
 def compress(binary):
-    bin_save("temp", binary[:len(binary) - 4])
-    run_cmd("-zx0 temp")
-    bin_crn = bin_load("temp.zx0")
-    run_cmd("del temp")
-    run_cmd("del temp.zx0")
-    bin_crn = binary[len(binary) - 4:] + bytearray(2) + bin_crn
-    return word_bin(len(bin_crn)) + bin_crn
+    tim_start = time.perf_counter()
+    bin_zx0 = compress_lib.zx0_compress(binary[:len(binary) - 4])
+    bin_crn = binary[len(binary) - 4:] + bytearray(2) + bin_zx0
+    bin_crn = word_bin(len(bin_crn)) + bin_crn
+    return bin_crn, compress_lib.unpack_time(bin_zx0), time.perf_counter() - tim_start
+
+
+### ---------------------------------------------------------------------------
+### get bank sizes (in KB) for a memory size
+### ---------------------------------------------------------------------------
+def sna_sizes(kb):
+    if kb == 64:
+        return [4,60]
+    elif kb >= 128 and kb % 64 == 0:
+        return [4,60,60,4] + [16] * int((kb - 128) / 16)
+    return None
+
+
+### ---------------------------------------------------------------------------
+### unpack RLE compressed MEM chunk
+### ---------------------------------------------------------------------------
+# $E5,n,b = byte b n times, $E5,0 = byte $E5
+def sna_unrle(binary):
+    bin_out = bytearray()
+    adr = 0
+    while adr < len(binary):
+        adr_rle = binary.find(b"\xe5", adr)
+        if adr_rle < 0:
+            adr_rle = len(binary)
+        bin_out += binary[adr:adr_rle]
+        if adr_rle + 1 >= len(binary):
+            break
+        if binary[adr_rle + 1] == 0:
+            bin_out.append(0xe5)
+            adr = adr_rle + 2
+        else:
+            bin_out += binary[adr_rle + 2:adr_rle + 3] * binary[adr_rle + 1]
+            adr = adr_rle + 3
+    return bytes(bin_out)
+
+
+### ---------------------------------------------------------------------------
+### find all 64K memory pages of a snapshot
+### ---------------------------------------------------------------------------
+# Returns {page: (adr, length, rle)} by reading only the chunk headers behind the
+# memory dump; MEM chunks replace pages of the memory dump.
+def sna_pages(bin_sna, report=True):
+    pages = {}
+
+    kb = word_get(bin_sna[107:109])
+    for page in range(int(kb / 64)):
+        pages[page] = (256 + page * 65536, 65536, False)
+
+    adr = 256 + kb * 1024
+    while adr + 8 <= len(bin_sna):
+        chunk_id = bin_sna[adr:adr + 4]
+        chunk_len = int.from_bytes(bin_sna[adr + 4:adr + 8], "little")
+        if chunk_id[:3] == "MEM".encode() and chunk_id[3] in range(48, 57):
+            pages[chunk_id[3] - 48] = (adr + 8, chunk_len, chunk_len != 65536)
+        elif report:
+            print(f"chunk {chunk_id.decode(errors='replace')} removed")
+        adr += 8 + chunk_len
+
+    return pages
+
+
+### ---------------------------------------------------------------------------
+### get memory banks of a snapshot, one 64K page is unpacked at a time
+### ---------------------------------------------------------------------------
+def sna_banks(bin_sna, pages, sizes):
+    page_last = -1
+    adr = 0
+    for size in sizes:
+        page = int(adr / 65536)
+        if page != page_last:
+            if page not in pages:
+                bin_page = bytes(65536)
+            else:
+                adr_page, len_page, rle = pages[page]
+                bin_page = bin_sna[adr_page:adr_page + len_page]
+                if rle:
+                    bin_page = sna_unrle(bin_page)
+            page_last = page
+        yield bin_page[adr % 65536:adr % 65536 + size * 1024]
+        adr += size * 1024
+
+
+### ---------------------------------------------------------------------------
+### get header for the flat memory dump of a snapshot
+### ---------------------------------------------------------------------------
+# version 3 is only needed for more than 128K, if there are no chunks
+def sna_head(bin_sna, kb):
+    bin_head = bytearray(bin_sna[:256])
+    bin_head[107:109] = word_bin(kb)
+    if bin_head[16] == 3 and kb <= 128:
+        bin_head[16] = 2
+    return bin_head
+
+
+### ---------------------------------------------------------------------------
+### get the flat snapshot, which unpacking has to give
+### ---------------------------------------------------------------------------
+def sna_expect(bin_sna):
+    pages = sna_pages(bin_sna, False)
+    kb = 64 * (max(pages) + 1) if len(pages) > 0 else 0
+    sizes = sna_sizes(kb)
+    if sizes is None:
+        raise ValueError("unsupported size")
+    return sna_head(bin_sna, kb) + b"".join(sna_banks(bin_sna, pages, sizes))
 
 
 ### ---------------------------------------------------------------------------
@@ -74,38 +202,78 @@ def compress_file(file):
     print("Compressing " + file.upper() + "...")
     
     bin_out = bytearray()
+    banks = []
+    keys_unique = []
 
-    # load file
-    binary = bin_load(file)
-    kb = int(binary[107])
-    if kb == 64:
-        sizes = [4,60]
-    elif kb == 128:
-        sizes = [4,60,60,4]
-    else:
-        print("Unsupported size")
-        return
+    # compress banks, identical ones only once (in parallel, if possible)
+    def banks_unique(bin_sna, pages, sizes):
+        for bin_bank in sna_banks(bin_sna, pages, sizes):
+            key = hashlib.sha256(bin_bank).digest()
+            banks.append((len(bin_bank), key))
+            if key not in keys_unique:
+                keys_unique.append(key)
+                yield (bin_bank,)
 
-    bin_out = binary[:256]
+    # map file
+    with open(file, "rb") as fil_sna:
+        with mmap.mmap(fil_sna.fileno(), 0, access=mmap.ACCESS_READ) as bin_sna:
+            len_org = len(bin_sna)
+            with compress_lib.stage("parse"):
+                pages = sna_pages(bin_sna)
+            kb = 64 * (max(pages) + 1) if len(pages) > 0 else 0
+            sizes = sna_sizes(kb)
+            if sizes is None:
+                print("Unsupported size")
+                return
+            bin_head = sna_head(bin_sna, kb)
+            banks_crn = dict(zip(keys_unique, compress_lib.area_map(compress, banks_unique(bin_sna, pages, sizes))))
+
+    bin_out = bin_head
+    banks_done = {}
     adr = 256
-    for size in sizes:
-        print(f"at {adr}..")
-        bin_out += compress(binary[adr:adr + size * 1024])
-        adr += size * 1024
+    for len_bank, key in banks:
+        bin_crn, tim_unpack, tim_compress = banks_crn[key]
+        if key in banks_done:
+            txt_time = f"same as at {banks_done[key]}"
+        else:
+            txt_time = f"{tim_compress:.1f}s"
+            banks_done[key] = adr
+        print(f"at {adr}.. {len_bank} -> {len(bin_crn)} ({len(bin_crn)/len_bank*100:.0f}%), {txt_time}")
+        compress_lib.metrics_area(f"at {adr}", len_bank, len(bin_crn))
 
-    run_cmd(f"ren {file} {file}.bak")
-    bin_save(file, bin_out)
+        # snapshot banks are always stored compressed, so this is a report only
+        compress_lib.unpack_check(len_bank, len(bin_crn), tim_unpack)
+        bin_out += bin_crn
+        adr += len_bank
+
+    with compress_lib.stage("save"):
+        os.replace(file, file + ".bak")
+        bin_save(file, bin_out)
 
-    len_org = len(binary)
     len_crn = len(bin_out)
+    compress_lib.metrics_file(len_org, len_crn)
     print(f"DONE! compressed from {len_org} to {len_crn} ({len_crn/len_org*100:.0f}%)")
     print("")
 
 
+### ---------------------------------------------------------------------------
+### unpack one compressed SNA
+### ---------------------------------------------------------------------------
+def decompress_sna(binary):
+    sizes = sna_sizes(word_get(binary[107:109]))
+    if sizes is None:
+        raise ValueError("unsupported size")
+
+    bin_out = binary[:256]
+    adr = 256
+    for size in sizes:
+        len_crn = word_get(binary[adr:adr + 2])
+        bin_out += compress_lib.area_unpack(binary[adr + 2:adr + 2 + len_crn])
+        adr += 2 + len_crn
+    return bin_out
+
+
 ### batch
-files = glob.glob(sys.argv[1])
-if len(files) == 0:
-    print("File(s) not found")
-else:
-    for file in files:
-        compress_file(file)
+if __name__ == "__main__":
+    compress_lib.main(compress_file, "compress_sna.py", "SNA", decompress_sna, expect=sna_expect)
+
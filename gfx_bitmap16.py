@@ -1,13 +1,32 @@
-import subprocess
-import sys
 import glob
+import sys
+import gfx_lib
 
+### ===========================================================================
+### SYMBOS 16 COLOUR BITMAP CONVERTER
+### ===========================================================================
+
+"""
+Generates SymbOS sgx and asm files with 16 colours from BMP graphics
+supports BMP files with 4/8bpp, uncompressed, SymbOS palette
+
+the sgx file contains one or more SGX16 blocks; large images are split
+into tiles, which fit into one block each. The asm file contains the same
+tiles, each with its own label (gfx16c, or gfx16c1, gfx16c2... for more
+than one tile) and header; it is not written, if a tile is wider or higher
+than 255 pixels, as the header of a graphic in asm files uses bytes
+
+
+usage:
+python3 gfx_bitmap16.py [filemask] [xlen] [ylen]
+
+example:
+
+python3 gfx_bitmap16.py *.bmp 64 32
+
+converts all BMP in this directory to symbos 16 colour sgx and asm files
+"""
 
-### ---------------------------------------------------------------------------
-### get word from binary
-### ---------------------------------------------------------------------------
-def word_get(binary):
-    return binary[0] + 256 * binary[1]
 
 
 ### ---------------------------------------------------------------------------
@@ -21,96 +40,50 @@ def bin_load(file):
 
 
 ### ---------------------------------------------------------------------------
-### save binary
+### generates sgx16 ASM from RAW
 ### ---------------------------------------------------------------------------
-def bin_save(file, binary):
-    fil_bin = open(file, "wb")
-    fil_bin.write(binary)
-    fil_bin.close()
+def gen_asm16(file, xlen, ylen, bin_raw):
 
+    fil_asm = file[:len(file) - 4] + ".asm"
 
-### ---------------------------------------------------------------------------
-### generates RAW from BMP
-### ---------------------------------------------------------------------------
-def bmp2raw(bin_bmp, xlen, ylen):
-    bin_raw = bytearray()
-
-    # check for valid BMP parameters
-    xorg = word_get(bin_bmp[18:20])
-    yorg = word_get(bin_bmp[22:24])
-
-    if bin_bmp[25] > 128:
-        yorg = 65536 - yorg
-    if (xorg != xlen) or (yorg != ylen):
-        print(f"wrong image size; must be {xlen} x {ylen}")
-    elif (bin_bmp[28] != 8) and (bin_bmp[28] != 4):
-        print("unsupported colourdepth; must be 4 or 8 bpp")
-    elif bin_bmp[30] != 0:
-        print("file must be uncompressed")
-    else:
-
-        if bin_bmp[28] == 4:
-            xbyt = int(xlen/2)
-        else:
-            xbyt = xlen
-
-        adr_beg = word_get(bin_bmp[10:12])
-        for i in range(ylen):
-            if bin_bmp[25] > 128:
-                adr_lin = adr_beg + i * xbyt
-            else:
-                adr_lin = adr_beg + (ylen - 1 - i) * xbyt
-
-            if bin_bmp[28] == 4:
-                for i in range(xbyt):
-                    bin_raw += bytearray([int(bin_bmp[adr_lin + i] / 16), bin_bmp[adr_lin + i] % 16])
-            else:
-                bin_raw += bin_bmp[adr_lin:adr_lin + xlen]
-
-    return bin_raw
-
+    tiles = gfx_lib.sgx_tiles16(xlen, ylen)
+    for xofs, yofs, xtil, ytil in tiles:
+        if xtil > 255 or ytil > 255:
+            print(f"no asm file; tiles of {xtil} x {ytil} don't fit into a byte header")
+            return
 
-### ---------------------------------------------------------------------------
-### generates sgx16 from RAW
-### ---------------------------------------------------------------------------
-def gen_asm16(bin_raw, xlen, ylen):
-    txt_asm = f"gfx16c db {int(xlen/2)},{xlen},{ylen}:dw $+7,$+4,{xlen}*{ylen}:db 5\n"
-    for i in range(ylen):
-        txt_asm += "db "
-        for j in range(0, xlen, 2):
-            byt = bin_raw[i * xlen + j] * 16 + bin_raw[i * xlen + j + 1]
-            hexstr = hex(65536 + byt)
-            hexstr = hexstr[len(hexstr) - 2:]
-            txt_asm += f"#{hexstr},"
-        txt_asm = txt_asm[:len(txt_asm)-1] + "\n"
-    print(txt_asm)
+    fil_txt = open(fil_asm, "w")
+    for i, (xofs, yofs, xtil, ytil) in enumerate(tiles):
+        label = "gfx16c" if len(tiles) == 1 else f"gfx16c{i + 1}"
+        bin_sgx16 = gfx_lib.sgx_block16(bin_raw, xlen, ytil, yofs * xlen + xofs, xtil)
+        gfx_lib.asm_write(fil_txt, bin_sgx16[8:], int(xtil/2), f"{label} db {int(xtil/2)},{xtil},{ytil}:dw $+7,$+4,{xtil}*{ytil}:db 5")
+    fil_txt.close()
 
 
 ### ---------------------------------------------------------------------------
-### generates sgx4 from BMP
+### generates sgx16 from BMP
 ### ---------------------------------------------------------------------------
 def gen_sgx16(file, xlen, ylen):
 
     fil_sgx16 = file[:len(file) - 4] + ".sgx"
 
     if file[len(file) - 4:] == '.bmp':
-        bin_raw = bmp2raw(bin_load(file), xlen, ylen)
+        bin_raw = gfx_lib.bmp2raw(bin_load(file), xlen, ylen)
         if len(bin_raw) == 0:
             return
     else:
         print("unknown filetype")
         return
 
-    #bin_sgx4  = sgx_block4(bin_raw, xlen, ylen, 0, xlen, [0, 16, 1, 17])
-    gen_asm16(bin_raw, xlen, ylen)
-    #bin_save(fil_sgx4, bin_sgx4)
+    gen_asm16(file, xlen, ylen, bin_raw)
+    gfx_lib.sgx_save16(fil_sgx16, bin_raw, xlen, ylen)
 
     print("DONE!")
 
 
 ### batch
 if len(sys.argv) != 4:
-    print("python3 gfx_bitmap4.py [filemask] [xlen] [ylen]")
+    print("python3 gfx_bitmap16.py [filemask] [xlen] [ylen]")
 else:
     files = glob.glob(sys.argv[1])
     if len(files) == 0:
@@ -1,5 +1,6 @@
 import glob
 import sys
+import gfx_lib
 
 
 """
@@ -24,13 +25,6 @@ python3 gfx_font.py 16 16 8 *.bmp
 """
 
 
-### ---------------------------------------------------------------------------
-### get word from binary
-### ---------------------------------------------------------------------------
-def word_get(binary):
-    return binary[0] + 256 * binary[1]
-
-
 ### ---------------------------------------------------------------------------
 ### load binary
 ### ---------------------------------------------------------------------------
@@ -50,46 +44,6 @@ def bin_save(file, binary):
     fil_bin.close()
 
 
-### ---------------------------------------------------------------------------
-### generates RAW from BMP
-### ---------------------------------------------------------------------------
-def bmp2raw(bin_bmp, xlen, ylen):
-    bin_raw = bytearray()
-
-    # check for valid BMP parameters
-    xorg = word_get(bin_bmp[18:20])
-    yorg = word_get(bin_bmp[22:24])
-    if bin_bmp[25] > 128:
-        yorg = 65536 - yorg
-    if (xorg != xlen) or (yorg != ylen):
-        print(f"wrong image size; must be {xlen} x {ylen}")
-    elif (bin_bmp[28] != 8) and (bin_bmp[28] != 4):
-        print("unsupported colourdepth; must be 4 or 8 bpp")
-    elif bin_bmp[30] != 0:
-        print("file must be uncompressed")
-    else:
-
-        if bin_bmp[28] == 4:
-            xbyt = int(xlen/2)
-        else:
-            xbyt = xlen
-
-        adr_beg = word_get(bin_bmp[10:12])
-        for i in range(ylen):
-            if bin_bmp[25] > 128:
-                adr_lin = adr_beg + i * xbyt
-            else:
-                adr_lin = adr_beg + (ylen - 1 - i) * xbyt
-
-            if bin_bmp[28] == 4:
-                for i in range(xbyt):
-                    bin_raw += bytearray([int(bin_bmp[adr_lin + i] / 16), bin_bmp[adr_lin + i] % 16])
-            else:
-                bin_raw += bin_bmp[adr_lin:adr_lin + xlen]
-
-    return bin_raw
-
-
 ### ---------------------------------------------------------------------------
 ### generates FNT from RAW
 ### ---------------------------------------------------------------------------
@@ -120,7 +74,7 @@ def gen_fnt(file, xcount, ycount, yheight, cstart):
 
     if file[len(file) - 4:] == '.bmp':
         bin_bmp = bin_load(file)
-        bin_raw = bmp2raw(bin_bmp, xlen, ylen)
+        bin_raw = gfx_lib.bmp2raw(bin_bmp, xlen, ylen)
         if len(bin_raw) == 0:
             return
         bin_fnt = raw2fnt(bin_raw, xcount, ycount, yheight, cstart)
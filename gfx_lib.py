@@ -0,0 +1,243 @@
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+### ===========================================================================
+### SHARED FUNCTIONS FOR THE GFX_* SCRIPTS
+### ===========================================================================
+
+"""
+BMP decoding and SGX packing used by all gfx_* scripts.
+
+The BMP header is read with struct (32 bit width and height, top-down and
+bottom-up images), and the pixel lines are read with their padding to 4
+bytes. The lines are unpacked as a whole, with NumPy if it is installed and
+with bytes.translate otherwise; both give the same result, so NumPy is
+optional.
+SGX blocks with 4 colours are packed with a table of the palette mapped bit
+patterns of all 4 pixel combinations instead of one loop per pixel. Images
+with 16 colours are split into tiles, which fit into one SGX16 block each.
+Assembler listings are written line by line into the file, optionally with
+the data in a binary file, which is included with incbin.
+
+usage:
+import gfx_lib
+pixels, xlen, ylen = gfx_lib.bmp_decode(bin_bmp)    # list of lines
+bin_raw = gfx_lib.bmp2raw(bin_bmp, xlen, ylen)      # all lines in one
+bin_blk = gfx_lib.sgx_block4(bin_raw, xtot, ytot, ofs, xlen, pal)
+bin_sgx = gfx_lib.sgx_image16(bin_raw, xlen, ylen)  # all SGX16 blocks
+gfx_lib.sgx_save16(fil_sgx, bin_raw, xlen, ylen)    # same, into a file
+gfx_lib.asm_write(fil_asm, bin_blk[3:], 16, "label db 4,16,8")
+"""
+
+
+NIBBLE_HIGH = bytes(byt >> 4 for byt in range(256))     # translate tables for
+NIBBLE_LOW  = bytes(byt & 15 for byt in range(256))     # unpacking 4bpp lines
+
+
+### ---------------------------------------------------------------------------
+### decode BMP
+### ---------------------------------------------------------------------------
+# returns the pixels as a list of lines from top to bottom (bytes with one
+# colour index per pixel), the width and the height; raises ValueError, if
+# the BMP is not supported
+def bmp_decode(bin_bmp):
+    if len(bin_bmp) < 54 or bin_bmp[:2] != b"BM":
+        raise ValueError("not a BMP file")
+    adr_beg = struct.unpack_from("<I", bin_bmp, 10)[0]
+    xlen, ylen, planes, bpp, compression = struct.unpack_from("<iiHHI", bin_bmp, 18)
+    if bpp != 8 and bpp != 4:
+        raise ValueError("unsupported colourdepth; must be 4 or 8 bpp")
+    if compression != 0:
+        raise ValueError("file must be uncompressed")
+
+    top_down = ylen < 0
+    ylen = abs(ylen)
+    len_line = (xlen * bpp + 31) // 32 * 4
+    if xlen <= 0 or adr_beg + len_line * ylen > len(bin_bmp):
+        raise ValueError("file too short")
+
+    if numpy is not None:
+        lines = numpy.frombuffer(bin_bmp, numpy.uint8, len_line * ylen, adr_beg).reshape(ylen, len_line)
+        if bpp == 4:
+            lines = numpy.stack((lines >> 4, lines & 15), axis=2).reshape(ylen, len_line * 2)
+        lines = lines[:, :xlen]
+        if not top_down:
+            lines = lines[::-1]
+        return [line.tobytes() for line in lines], xlen, ylen
+
+    pixels = []
+    for i in range(ylen):
+        adr_lin = adr_beg + i * len_line
+        line = bin_bmp[adr_lin:adr_lin + len_line]
+        if bpp == 4:
+            line_4 = bytearray(len_line * 2)
+            line_4[0::2] = line.translate(NIBBLE_HIGH)
+            line_4[1::2] = line.translate(NIBBLE_LOW)
+            line = line_4
+        pixels.append(bytes(line[:xlen]))
+    if not top_down:
+        pixels.reverse()
+    return pixels, xlen, ylen
+
+
+### ---------------------------------------------------------------------------
+### generates RAW from BMP
+### ---------------------------------------------------------------------------
+# returns all lines from top to bottom in one binary (one colour index per
+# pixel), or an empty binary, if the BMP is not supported or has another size
+def bmp2raw(bin_bmp, xlen, ylen):
+    try:
+        pixels, xorg, yorg = bmp_decode(bin_bmp)
+    except ValueError as error:
+        print(error)
+        return bytearray()
+    if (xorg != xlen) or (yorg != ylen):
+        print(f"wrong image size; must be {xlen} x {ylen}")
+        return bytearray()
+    return bytearray(b"".join(pixels))
+
+
+HEX_BYTE = [f"#{byt:02x}" for byt in range(256)]         # "#00"..."#ff"
+
+SHIFT_6 = bytes((byt << 6) & 255 for byt in range(256))  # translate tables for
+SHIFT_4 = bytes((byt << 4) & 255 for byt in range(256))  # packing 4 pixels with
+SHIFT_2 = bytes((byt << 2) & 255 for byt in range(256))  # 2 bit into one index
+
+
+### ---------------------------------------------------------------------------
+### get the pixels of a block from RAW
+### ---------------------------------------------------------------------------
+# returns the first xrow pixels of ytot lines with xtot pixels each, starting
+# at ofs; raises IndexError, if RAW is too short for lines with xlen pixels
+def raw_block(bin_raw, xtot, ytot, ofs, xlen, xrow):
+    if ytot > 0 and len(bin_raw) < (ytot - 1) * xtot + ofs + xlen:
+        raise IndexError("RAW data too short for the block")
+    pixels = bytearray(xrow * ytot)
+    for i in range(ytot):
+        adr = i * xtot + ofs
+        pixels[i * xrow:(i + 1) * xrow] = bin_raw[adr:adr + xrow]
+    return pixels
+
+
+### ---------------------------------------------------------------------------
+### generates one SGX4 block from RAW
+### ---------------------------------------------------------------------------
+# the 4 pixels of each byte are packed to an index (2 bit per pixel) for a
+# whole block at once, which is then translated with a table containing the
+# palette mapped bit patterns of all 256 pixel combinations
+def sgx_block4(bin_raw, xtot, ytot, ofs, xlen, pal):
+    len_line = xlen // 4
+    bin_blk = bytearray(3 + len_line * ytot)
+    bin_blk[:3] = bytes([len_line, xlen, ytot])
+
+    pixels = raw_block(bin_raw, xtot, ytot, ofs, xlen, len_line * 4)
+    colours = min(len(pal), 4)
+    if len(pixels) and max(pixels) >= colours:
+        raise IndexError("colour index out of palette")
+
+    lut = bytearray(256)
+    for idx in range(256):
+        pens = [idx >> 6, (idx >> 4) & 3, (idx >> 2) & 3, idx & 3]
+        if max(pens) < colours:
+            byt = pal[pens[0]] * 8 + pal[pens[1]] * 4 + pal[pens[2]] * 2 + pal[pens[3]]
+            if byt <= 255:
+                lut[idx] = byt
+
+    index = int.from_bytes(pixels[0::4].translate(SHIFT_6), "big") \
+          + int.from_bytes(pixels[1::4].translate(SHIFT_4), "big") \
+          + int.from_bytes(pixels[2::4].translate(SHIFT_2), "big") \
+          + int.from_bytes(pixels[3::4], "big")
+    bin_blk[3:] = index.to_bytes(len_line * ytot, "big").translate(lut)
+    return bin_blk
+
+
+SGX16_BLOCK_MAX = 16384     # max bytes of pixel data in one SGX16 block
+SGX16_TILE_STEP = 8         # tile widths are multiples of this (in pixels)
+
+
+### ---------------------------------------------------------------------------
+### generates one SGX16 block from RAW
+### ---------------------------------------------------------------------------
+# the header contains the bytes per line, width and height as words; pairs
+# of pixels are packed for a whole block at once
+def sgx_block16(bin_raw, xtot, ytot, ofs, xlen):
+    len_line = xlen // 2
+    bin_blk = bytearray(8 + len_line * ytot)
+    bin_blk[:8] = struct.pack("<BBHHH", 64, 5, len_line, xlen, ytot)
+
+    pixels = raw_block(bin_raw, xtot, ytot, ofs, xlen, len_line * 2)
+
+    if len(pixels) == 0 or max(pixels) < 16:
+        index = int.from_bytes(pixels[0::2].translate(SHIFT_4), "big") \
+              + int.from_bytes(pixels[1::2], "big")
+        bin_blk[8:] = index.to_bytes(len_line * ytot, "big")
+    else:
+        bin_blk[8:] = bytes(byt if byt <= 255 else 0 for byt in
+            (hig * 16 + low for hig, low in zip(pixels[0::2], pixels[1::2])))
+    return bin_blk
+
+
+### ---------------------------------------------------------------------------
+### splits an image into SGX16 tiles
+### ---------------------------------------------------------------------------
+# returns the tiles as (xofs, yofs, xlen, ylen), line by line from left to
+# right; the tiles are as wide as possible (full height strips, if they fit),
+# so that each one fits into a block with max SGX16_BLOCK_MAX bytes
+def sgx_tiles16(xlen, ylen):
+    tiles = []
+    if xlen <= 0 or ylen <= 0:
+        return tiles
+    ytil = min(ylen, SGX16_BLOCK_MAX // (SGX16_TILE_STEP // 2))
+    xtil = min(xlen, SGX16_BLOCK_MAX // ytil * 2 // SGX16_TILE_STEP * SGX16_TILE_STEP)
+    for yofs in range(0, ylen, ytil):
+        for xofs in range(0, xlen, xtil):
+            tiles.append((xofs, yofs, min(xtil, xlen - xofs), min(ytil, ylen - yofs)))
+    return tiles
+
+
+### ---------------------------------------------------------------------------
+### generates SGX16 blocks for a whole image from RAW
+### ---------------------------------------------------------------------------
+def sgx_image16(bin_raw, xlen, ylen):
+    bin_sgx = bytearray()
+    for xofs, yofs, xtil, ytil in sgx_tiles16(xlen, ylen):
+        bin_sgx += sgx_block16(bin_raw, xlen, ytil, yofs * xlen + xofs, xtil)
+    return bin_sgx
+
+
+### ---------------------------------------------------------------------------
+### saves SGX16 blocks for a whole image from RAW
+### ---------------------------------------------------------------------------
+# writes one block after another into the file, so only one block is in
+# memory at a time
+def sgx_save16(file, bin_raw, xlen, ylen):
+    fil_sgx = open(file, "wb")
+    for xofs, yofs, xtil, ytil in sgx_tiles16(xlen, ylen):
+        fil_sgx.write(sgx_block16(bin_raw, xlen, ytil, yofs * xlen + xofs, xtil))
+    fil_sgx.close()
+
+
+### ---------------------------------------------------------------------------
+### writes assembler code from binary
+### ---------------------------------------------------------------------------
+# writes the label line (if any) and "db" lines with len_line bytes each,
+# indented by spc spaces, into the open text file fil_asm; with fil_inc the
+# binary is saved to this file and included with "incbin" instead
+def asm_write(fil_asm, bin_asm, len_line, labtxt="", spc=0, fil_inc=None):
+    if labtxt:
+        fil_asm.write(labtxt + "\n")
+    if fil_inc is not None:
+        fil_bin = open(fil_inc, "wb")
+        fil_bin.write(bin_asm)
+        fil_bin.close()
+        fil_asm.write(f'{spc*" "}incbin "{os.path.basename(fil_inc)}"\n')
+        return
+    lin_beg = f"{spc*' '}db "
+    for adr in range(0, len(bin_asm), len_line):
+        fil_asm.write(lin_beg + ",".join(map(HEX_BYTE.__getitem__, bin_asm[adr:adr + len_line])) + "\n")
@@ -1,5 +1,6 @@
 import glob
 import sys
+import gfx_lib
 
 
 ### ===========================================================================
@@ -31,13 +32,6 @@ converts all BMP in this directory to cpc wallpapers
 
 
 
-### ---------------------------------------------------------------------------
-### get word from binary
-### ---------------------------------------------------------------------------
-def word_get(binary):
-    return binary[0] + 256 * binary[1]
-
-
 ### ---------------------------------------------------------------------------
 ### load binary
 ### ---------------------------------------------------------------------------
@@ -57,46 +51,6 @@ def bin_save(file, binary):
     fil_bin.close()
 
 
-### ---------------------------------------------------------------------------
-### generates RAW from BMP
-### ---------------------------------------------------------------------------
-def bmp2raw(bin_bmp, xlen, ylen):
-    bin_raw = bytearray()
-
-    # check for valid BMP parameters
-    xorg = word_get(bin_bmp[18:20])
-    yorg = word_get(bin_bmp[22:24])
-    if bin_bmp[25] > 128:
-        yorg = 65536 - yorg
-    if (xorg != xlen) or (yorg != ylen):
-        print(f"wrong image size; must be {xlen} x {ylen}")
-    elif (bin_bmp[28] != 8) and (bin_bmp[28] != 4):
-        print("unsupported colourdepth; must be 4 or 8 bpp")
-    elif bin_bmp[30] != 0:
-        print("file must be uncompressed")
-    else:
-
-        if bin_bmp[28] == 4:
-            xbyt = int(xlen/2)
-        else:
-            xbyt = xlen
-
-        adr_beg = word_get(bin_bmp[10:12])
-        for i in range(ylen):
-            if bin_bmp[25] > 128:
-                adr_lin = adr_beg + i * xbyt
-            else:
-                adr_lin = adr_beg + (ylen - 1 - i) * xbyt
-
-            if bin_bmp[28] == 4:
-                for i in range(xbyt):
-                    bin_raw += bytearray([int(bin_bmp[adr_lin + i] / 16), bin_bmp[adr_lin + i] % 16])
-            else:
-                bin_raw += bin_bmp[adr_lin:adr_lin + xlen]
-
-    return bin_raw
-
-
 ### ---------------------------------------------------------------------------
 ### generates 4 colour palette translation table from BMP
 ### ---------------------------------------------------------------------------
@@ -117,38 +71,6 @@ def gen_pal4(bin_bmp):
     return pen
 
 
-### ---------------------------------------------------------------------------
-### generates one SGX4 block from RAW
-### ---------------------------------------------------------------------------
-def sgx_block4(bin_raw, xtot, ytot, ofs, xlen, pal):
-    bin_blk = bytearray([int(xlen/4), xlen, ytot])
-    for i in range(ytot):
-        for j in range(int(xlen / 4)):
-            adr = i * xtot + ofs + j * 4
-            byt = 0
-            for k in range(4):
-                byt += pal[bin_raw[adr + k]] * (2 ** (3-k))
-            if byt > 255:
-                byt = 0
-            bin_blk += bytearray([byt])
-    return bin_blk
-
-
-### ---------------------------------------------------------------------------
-### generates one SGX16 block from RAW
-### ---------------------------------------------------------------------------
-def sgx_block16(bin_raw, xtot, ytot, ofs, xlen):
-    bin_blk = bytearray([64, 5, int(xlen/2), 0, xlen, 0, ytot, 0])
-    for i in range(ytot):
-        for j in range(int(xlen / 2)):
-            adr = i * xtot + ofs + j * 2
-            byt = bin_raw[adr] * 16 + bin_raw[adr + 1]
-            if byt > 255:
-                byt = 0
-            bin_blk += bytearray([byt])
-    return bin_blk
-
-
 ### ---------------------------------------------------------------------------
 ### generates SGX wallpaper from BMP or RAW
 ### ---------------------------------------------------------------------------
@@ -165,7 +87,7 @@ def gen_sgx_wallpaper(file, mode):
 
     if   file[len(file) - 4:] == '.bmp':
         bin_bmp = bin_load(file)
-        bin_raw = bmp2raw(bin_bmp, xlen, ylen)
+        bin_raw = gfx_lib.bmp2raw(bin_bmp, xlen, ylen)
         if len(bin_raw) == 0:
             return
         pal = gen_pal4(bin_bmp)
@@ -177,13 +99,10 @@ def gen_sgx_wallpaper(file, mode):
         return
 
     if mode == "4":
-        bin_sgx  = sgx_block4(bin_raw,  320, 200,   0, 160, pal)
-        bin_sgx += sgx_block4(bin_raw,  320, 200, 160, 160, pal)
+        bin_sgx  = gfx_lib.sgx_block4(bin_raw,  320, 200,   0, 160, pal)
+        bin_sgx += gfx_lib.sgx_block4(bin_raw,  320, 200, 160, 160, pal)
     else:
-        bin_sgx  = sgx_block16(bin_raw, 512, 212,   0, 152)
-        bin_sgx += sgx_block16(bin_raw, 512, 212, 152, 152)
-        bin_sgx += sgx_block16(bin_raw, 512, 212, 304, 152)
-        bin_sgx += sgx_block16(bin_raw, 512, 212, 456,  56)
+        bin_sgx = gfx_lib.sgx_image16(bin_raw, 512, 212)
 
     bin_save(fil_sgx, bin_sgx)
     print("DONE!")
@@ -0,0 +1,506 @@
+import heapq
+
+
+### ===========================================================================
+### ZX0 COMPRESSOR
+### ===========================================================================
+
+"""
+In-process ZX0 compressor, producing exactly the same output as the ZX0 v2.2
+reference tool by Einar Saukas (-zx0 [+N] file), so the compress_* scripts can
+pack areas without writing temp files and spawning a process per area.
+
+The optimal parse follows the reference optimizer step by step; literal runs
+of offsets without a match at the current position are evaluated lazily via a
+heap, so the work per byte depends on the number of matching offsets instead
+of the full 32K window.
+The decompressor is used to verify compressed files against their originals.
+
+usage:
+import zx0
+bin_crn = zx0.compress(binary)          # like "-zx0 file"
+bin_crn = zx0.compress(binary, 296)     # like "-zx0 +296 file"
+bin_crn = zx0.compress(binary, greedy=True)     # fast draft, not optimal
+binary = zx0.decompress(bin_crn)        # like "dzx0 file"
+binary = zx0.decompress(bin_crn, bin_prefix)
+"""
+
+
+INITIAL_OFFSET = 1
+MAX_OFFSET_ZX0 = 32640      # offset limit of the optimal mode
+MAX_OFFSET_ZX7 = 2176       # offset limit of the quick mode (-q)
+GREEDY_CHAIN = 16           # match candidates checked per byte by the greedy parser
+
+
+### ---------------------------------------------------------------------------
+### number of bits of an elias gamma code
+### ---------------------------------------------------------------------------
+def elias_gamma_bits(value):
+    return 2 * value.bit_length() - 1
+
+
+### ---------------------------------------------------------------------------
+### highest offset, which can be used at an index
+### ---------------------------------------------------------------------------
+def offset_ceiling(index, offset_limit):
+    if index > offset_limit:
+        return offset_limit
+    if index < INITIAL_OFFSET:
+        return INITIAL_OFFSET
+    return index
+
+
+### ---------------------------------------------------------------------------
+### find optimal block chain
+### ---------------------------------------------------------------------------
+# A block is a tuple (bits, index, offset, chain), offset 0 means literals.
+def optimize(binary, skip, offset_limit):
+    size = len(binary)
+    max_offset = offset_ceiling(size - 1, offset_limit)
+
+    gamma_bits = [0] + [elias_gamma_bits(i) for i in range(1, max(size, 256) + 2)]
+    offset_bits = [0] + [8 + gamma_bits[(i - 1) // 128 + 1] for i in range(1, max_offset + 1)]
+
+    last_literal = [None] * (max_offset + 1)
+    last_match   = [None] * (max_offset + 1)
+    match_start  = [0]    * (max_offset + 1)    # index, where the match run started
+    match_index  = [-2]   * (max_offset + 1)    # index of the last match
+    optimal      = [None] * size
+    optimal_bits = [0]    * size
+    best_length  = [0]    * max(size, 3)
+    best_length[2] = 2
+
+    # positions of every byte value, used to find the matching offsets
+    positions = [[] for i in range(256)]
+    for i in range(skip):
+        positions[binary[i]].append(i)
+
+    # literal candidates of all offsets without a match, ordered by
+    # (bits - 8 * index, offset); entries become stale when the last match
+    # of their offset changes or their elias gamma length grows
+    heap = []
+    heap_limit = 4096
+    heappush = heapq.heappush
+    last_match[INITIAL_OFFSET] = (-1, skip - 1, INITIAL_OFFSET, None)
+    heap.append((-1 + 8 - 8 * skip + 2, INITIAL_OFFSET, skip + 1, last_match[INITIAL_OFFSET]))
+
+    run_last = []
+    for index in range(skip, size):
+        pos_min = index - offset_ceiling(index, offset_limit)
+        max_last = offset_ceiling(index - 1, offset_limit)
+        index_last = index - 1
+        best_bits = 1 << 62
+        best_offset = 0
+        best_block = None
+        best_length_size = 2
+        run_new = []
+
+        # copy from last/new offset (offsets in ascending order)
+        byte_pos = positions[binary[index]]
+        if index != skip:
+            for pos in reversed(byte_pos):
+                if pos < pos_min:
+                    break
+                offset = index - pos
+                run_new.append(offset)
+
+                if match_index[offset] == index_last:
+                    # continue match run
+                    match_index[offset] = index
+                    length_match = index - match_start[offset] + 1
+                    literal = last_literal[offset]
+                else:
+                    # start new match run
+                    match_index[offset] = index
+                    match_start[offset] = index
+                    block = last_match[offset]
+                    if block is not None and offset <= max_last:
+                        length = index_last - block[1]
+                        literal = (block[0] + 1 + gamma_bits[length] + length * 8, index_last, 0, block)
+                        last_literal[offset] = literal
+                    else:
+                        last_literal[offset] = None
+                        continue
+                    length_match = 1
+
+                if length_match > 1:
+                    if best_length_size < length_match:
+                        length = best_length[best_length_size]
+                        bits = optimal_bits[index - length] + gamma_bits[length - 1]
+                        while best_length_size < length_match:
+                            best_length_size += 1
+                            bits2 = optimal_bits[index - best_length_size] + gamma_bits[best_length_size - 1]
+                            if bits2 <= bits:
+                                best_length[best_length_size] = best_length_size
+                                bits = bits2
+                            else:
+                                best_length[best_length_size] = best_length[best_length_size - 1]
+                    length = best_length[length_match]
+                    bits = optimal_bits[index - length] + offset_bits[offset] + gamma_bits[length - 1]
+                    if literal is not None:
+                        bits2 = literal[0] + 1 + gamma_bits[index - literal[1]]
+                        if bits2 <= bits:
+                            block = (bits2, index, offset, literal)
+                            bits = bits2
+                        else:
+                            block = (bits, index, offset, optimal[index - length])
+                    else:
+                        block = (bits, index, offset, optimal[index - length])
+                elif literal is not None:
+                    bits = literal[0] + 1 + gamma_bits[index - literal[1]]
+                    block = (bits, index, offset, literal)
+                else:
+                    continue
+
+                last_match[offset] = block
+                if bits < best_bits:
+                    best_bits = bits
+                    best_offset = offset
+                    best_block = block
+        byte_pos.append(index)
+
+        # offsets, whose match run ended, are literal candidates again
+        for offset in run_last:
+            if match_index[offset] != index:
+                block = last_match[offset]
+                if block is not None:
+                    length = (index - block[1]).bit_length()
+                    heappush(heap, (block[0] - 8 * block[1] + 2 * length, offset, block[1] + (1 << length), block))
+        run_last = run_new
+        if len(heap) > heap_limit:
+            heap = [entry for entry in heap if last_match[entry[1]] is entry[3] and match_index[entry[1]] != index]
+            heapq.heapify(heap)
+            heap_limit = 2 * len(heap) + 4096
+
+        # copy literals
+        while heap:
+            key, offset, expiry, block = heap[0]
+            if last_match[offset] is not block or match_index[offset] == index:
+                heapq.heappop(heap)
+            elif expiry <= index:
+                length = (index - block[1]).bit_length()
+                heapq.heapreplace(heap, (block[0] - 8 * block[1] + 2 * length, offset, block[1] + (1 << length), block))
+            else:
+                bits = key + 8 * index
+                if bits < best_bits or (bits == best_bits and offset < best_offset):
+                    best_bits = bits
+                    best_block = (bits, index, 0, block)
+                break
+
+        optimal[index] = best_block
+        optimal_bits[index] = best_bits
+
+    return optimal[size - 1]
+
+
+### ---------------------------------------------------------------------------
+### length of the match between two positions
+### ---------------------------------------------------------------------------
+def match_length(binary, pos, index):
+    size = len(binary)
+    length = 0
+    while index + length < size and binary[pos + length] == binary[index + length]:
+        length += 1
+    return length
+
+
+### ---------------------------------------------------------------------------
+### find block chain with a greedy parse (fast, but bigger output)
+### ---------------------------------------------------------------------------
+# Takes the longest match of the last GREEDY_CHAIN positions with the same two
+# bytes, or a match with the last offset after literals, if it is at most one
+# byte shorter. Matches of 2 bytes are only used with offsets up to 128, with
+# offsets above 1024 at least 4 bytes are required.
+def parse_greedy(binary, skip, offset_limit):
+    size = len(binary)
+    heads = {}      # positions of every pair of bytes
+
+    def insert(pos):
+        if pos + 1 < size:
+            heads.setdefault(binary[pos] * 256 + binary[pos + 1], []).append(pos)
+
+    for pos in range(skip):
+        insert(pos)
+
+    block = (-1, skip - 1, INITIAL_OFFSET, None)
+    last_offset = INITIAL_OFFSET
+    index = skip
+    literal_start = skip
+    while index < size:
+        best_length = 0
+        best_offset = 0
+        if index > skip and index + 1 < size:
+            max_offset = min(index, offset_limit)
+            for pos in reversed(heads.get(binary[index] * 256 + binary[index + 1], [])[-GREEDY_CHAIN:]):
+                offset = index - pos
+                if offset > max_offset:
+                    break
+                if offset == last_offset and index == literal_start:
+                    continue
+                length = match_length(binary, pos, index)
+                if length > best_length:
+                    best_length = length
+                    best_offset = offset
+                    if index + length == size:
+                        break
+            if best_length < 2 or (best_length == 2 and best_offset > 128) or (best_length == 3 and best_offset > 1024):
+                best_length = 0
+
+        rep_length = 0
+        if index > literal_start and last_offset <= index:
+            rep_length = match_length(binary, index - last_offset, index)
+            if rep_length > 0 and rep_length + 1 >= best_length:
+                best_length = rep_length
+                best_offset = last_offset
+
+        if best_length == 0:
+            insert(index)
+            index += 1
+            continue
+
+        # copy literals, then copy from last/new offset
+        if index > literal_start:
+            block = (0, index - 1, 0, block)
+        block = (0, index + best_length - 1, best_offset, block)
+        last_offset = best_offset
+        for pos in range(index, index + best_length):
+            insert(pos)
+        index += best_length
+        literal_start = index
+
+    if index > literal_start:
+        block = (0, index - 1, 0, block)
+    return block
+
+
+### ---------------------------------------------------------------------------
+### generate compressed data from optimal block chain
+### ---------------------------------------------------------------------------
+def encode(optimal, binary, skip, invert_mode=True):
+    blocks = []
+    while optimal is not None:
+        blocks.append(optimal)
+        optimal = optimal[3]
+    blocks.reverse()
+
+    bin_out = bytearray()
+    bit_mask = 0
+    bit_index = 0
+    backtrack = True
+
+    def write_bit(value):
+        nonlocal bit_mask, bit_index, backtrack
+        if backtrack:
+            if value:
+                bin_out[-1] |= 1
+            backtrack = False
+        else:
+            if bit_mask == 0:
+                bit_mask = 128
+                bit_index = len(bin_out)
+                bin_out.append(0)
+            if value:
+                bin_out[bit_index] |= bit_mask
+            bit_mask >>= 1
+
+    def write_gamma(value, invert):
+        i = 1 << (value.bit_length() - 1)
+        while i > 1:
+            i >>= 1
+            write_bit(0)
+            write_bit((value & i == 0) if invert else (value & i != 0))
+        write_bit(1)
+
+    last_offset = INITIAL_OFFSET
+    adr = skip
+    for i in range(1, len(blocks)):
+        length = blocks[i][1] - blocks[i - 1][1]
+        offset = blocks[i][2]
+        if offset == 0:
+            # copy literals
+            write_bit(0)
+            write_gamma(length, False)
+            bin_out += binary[adr:adr + length]
+        elif offset == last_offset:
+            # copy from last offset
+            write_bit(0)
+            write_gamma(length, False)
+        else:
+            # copy from new offset
+            write_bit(1)
+            write_gamma((offset - 1) // 128 + 1, invert_mode)
+            bin_out.append((127 - (offset - 1) % 128) << 1)
+            backtrack = True
+            write_gamma(length - 1, False)
+            last_offset = offset
+        adr += length
+
+    # end marker
+    write_bit(1)
+    write_gamma(256, invert_mode)
+    return bytes(bin_out)
+
+
+### ---------------------------------------------------------------------------
+### compress data
+### ---------------------------------------------------------------------------
+# The first [skip] bytes are not compressed, but can be referenced by matches
+# (they have to be placed in front of the decompressed data).
+# greedy = use the greedy parser instead of the optimal one
+def compress(binary, skip=0, quick=False, greedy=False):
+    if skip >= len(binary):
+        raise ValueError("zx0: skipping entire input")
+    if quick:
+        offset_limit = MAX_OFFSET_ZX7
+    else:
+        offset_limit = MAX_OFFSET_ZX0
+    if greedy:
+        return encode(parse_greedy(binary, skip, offset_limit), binary, skip)
+    return encode(optimize(binary, skip, offset_limit), binary, skip)
+
+
+### ---------------------------------------------------------------------------
+### decompress data
+### ---------------------------------------------------------------------------
+# bin_prefix = the skipped bytes, which have been used as dictionary only (the
+# returned data doesn't include them)
+def decompress(bin_crn, bin_prefix=b"", invert_mode=True):
+    bin_out = bytearray(bin_prefix)
+    adr = 0
+    bit_mask = 0
+    bit_value = 0
+    backtrack = False
+
+    def read_bit():
+        nonlocal adr, bit_mask, bit_value, backtrack
+        if backtrack:
+            backtrack = False
+            return bin_crn[adr - 1] & 1
+        bit_mask >>= 1
+        if bit_mask == 0:
+            bit_mask = 128
+            bit_value = bin_crn[adr]
+            adr += 1
+        return 1 if bit_value & bit_mask else 0
+
+    def read_gamma(invert):
+        value = 1
+        while not read_bit():
+            value = value << 1 | (read_bit() ^ invert)
+        return value
+
+    def copy(offset, length):
+        start = len(bin_out) - offset
+        if start < 0:
+            raise ValueError("zx0: offset outside of data")
+        if offset >= length:
+            bin_out.extend(bin_out[start:start + length])
+        else:
+            bin_out.extend((bin_out[start:] * (length // offset + 1))[:length])
+
+    last_offset = INITIAL_OFFSET
+    new_offset = False
+    while True:
+        if not new_offset:
+            # copy literals
+            length = read_gamma(0)
+            bin_out += bin_crn[adr:adr + length]
+            adr += length
+            if read_bit():
+                new_offset = True
+                continue
+            # copy from last offset
+            copy(last_offset, read_gamma(0))
+        else:
+            # copy from new offset
+            msb = read_gamma(1 if invert_mode else 0)
+            if msb == 256:
+                return bytes(bin_out[len(bin_prefix):])
+            last_offset = msb * 128 - (bin_crn[adr] >> 1)
+            adr += 1
+            backtrack = True
+            copy(last_offset, read_gamma(0) + 1)
+        new_offset = read_bit()
+
+
+### ---------------------------------------------------------------------------
+### count Z80 T-states for decompressing with the standard decompressor
+### ---------------------------------------------------------------------------
+# Follows dzx0_standard (Einar Saukas & Urusergi) instruction by instruction.
+# Only the control and stop bits of the elias gamma codes can start a new
+# group of 8 bits, so all other bits are read without refill check.
+def unpack_tstates(bin_crn):
+    adr = 0
+    bits = 0x80                         # register A
+    tstates = 10 + 11 + 6 + 7           # ld bc,$ffff:push bc:inc bc:ld a,$80
+
+    def bit_read(checked):
+        nonlocal adr, bits, tstates
+        bits <<= 1                      # add a,a
+        carry = bits >> 8
+        bits &= 255
+        tstates += 4
+        if checked:
+            if bits:
+                tstates += 12           # jr nz
+            else:
+                carry_new = bin_crn[adr] >> 7
+                bits = (bin_crn[adr] << 1 | carry) & 255
+                carry = carry_new
+                adr += 1
+                tstates += 7 + 7 + 6 + 4    # jr nz:ld a,(hl):inc hl:rla
+        return carry
+
+    def elias(value, invert, backtrack):
+        nonlocal tstates
+        while True:
+            if not backtrack:
+                if bit_read(True):
+                    tstates += 11       # ret c
+                    return value
+                tstates += 5            # ret c
+            backtrack = False
+            value = value * 2 + (bit_read(False) ^ invert)
+            tstates += 8 + 8 + 12       # rl c:rl b:jr
+
+    def ldir(length):
+        return 21 * length - 5
+
+    new_offset = False
+    length = 0
+    while True:
+        if not new_offset:
+            # copy literals
+            tstates += 17 + 4           # call dzx0s_elias:inc c
+            length = elias(1, 0, False)
+            tstates += ldir(length)
+            adr += length
+            new_offset = bit_read(False)
+            if new_offset:
+                tstates += 12           # jr c
+                continue
+            tstates += 7 + 17 + 4       # jr c:call dzx0s_elias:inc c
+            length = elias(1, 0, False)
+        else:
+            # copy from new offset
+            tstates += 10 + 7 + 17      # pop bc:ld c,$fe:call dzx0s_elias_loop
+            value = elias(1, 1, False)
+            tstates += 4                # inc c
+            if value == 256:
+                tstates += 11           # ret z
+                return tstates
+            tstates += 5 + 4 + 7 + 6 + 8 + 8 + 11 + 10
+            adr += 1
+            if bin_crn[adr - 1] & 1:
+                length = 1
+                tstates += 10           # call nc
+            else:
+                tstates += 17           # call nc
+                length = elias(1, 0, True)
+            length += 1
+            tstates += 6 + 12           # inc bc:jr dzx0s_copy
+
+        # copy from offset
+        tstates += 19 + 11 + 11 + ldir(length) + 10 + 19
+        new_offset = bit_read(False)
+        tstates += 7 if new_offset else 12  # jr nc